@@ -2,7 +2,7 @@ from sqlalchemy import text
 from database import engine
 
 def add_missing_columns():
-    """Add missing authentication columns to users table"""
+    """Add missing columns to existing tables (authentication fields, tally version, AI enrichment, FCM token health)"""
     
     sql_commands = [
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS name VARCHAR(255);",
@@ -11,7 +11,16 @@ def add_missing_columns():
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS google_id VARCHAR(255);",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN DEFAULT FALSE;",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP WITH TIME ZONE;",
-        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_google_id ON users(google_id) WHERE google_id IS NOT NULL;"
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_google_id ON users(google_id) WHERE google_id IS NOT NULL;",
+        "ALTER TABLE policy_vote_tallies ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE policies ADD COLUMN IF NOT EXISTS ai_status VARCHAR(20) NOT NULL DEFAULT 'done';",
+        "ALTER TABLE policies ADD COLUMN IF NOT EXISTS ai_attempts INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE policies ADD COLUMN IF NOT EXISTS ai_error TEXT;",
+        "ALTER TABLE policies ADD COLUMN IF NOT EXISTS ai_next_attempt_at TIMESTAMP WITH TIME ZONE;",
+        "ALTER TABLE policies ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255);",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS fcm_failure_count INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS fcm_quarantined_until TIMESTAMP WITH TIME ZONE;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS notification_categories VARCHAR(100)[];"
     ]
     
     with engine.connect() as connection:
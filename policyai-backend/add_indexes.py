@@ -0,0 +1,32 @@
+from sqlalchemy import text
+from database import engine
+
+def add_missing_indexes():
+    """Add performance indexes to existing tables (create_all only indexes new tables)"""
+    
+    sql_commands = [
+        "CREATE INDEX IF NOT EXISTS ix_votes_policy_id_stance ON votes(policy_id, stance);",
+        "CREATE INDEX IF NOT EXISTS ix_policies_active_created_at ON policies(is_active, created_at, id);",
+        "CREATE INDEX IF NOT EXISTS ix_policies_active_ends_at ON policies(is_active, ends_at, id);",
+        "CREATE INDEX IF NOT EXISTS ix_policies_category_created_at ON policies(category, is_active, created_at, id);",
+        "CREATE INDEX IF NOT EXISTS ix_policies_category_ends_at ON policies(category, is_active, ends_at, id);",
+        "CREATE INDEX IF NOT EXISTS ix_policy_vote_tallies_total_votes ON policy_vote_tallies(total_votes, policy_id);",
+        "CREATE INDEX IF NOT EXISTS ix_comments_policy_created_at ON comments(policy_id, created_at, id);",
+        "CREATE INDEX IF NOT EXISTS ix_policies_ai_status ON policies(ai_status, updated_at);",
+        "CREATE INDEX IF NOT EXISTS ix_users_fcm_token ON users(fcm_token);",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_policies_idempotency_key ON policies(idempotency_key);",
+    ]
+    
+    with engine.connect() as connection:
+        for sql in sql_commands:
+            try:
+                connection.execute(text(sql))
+                connection.commit()
+                print(f"✅ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"❌ Error: {e}")
+    
+    print("✅ All indexes added successfully!")
+
+if __name__ == "__main__":
+    add_missing_indexes()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import bindparam, func, or_, select
+from database import SessionLocal
+import models  # noqa: F401 - register all mappers
+from models.policy import Policy
+from services import ai_service
+from services.analysis_cache import analysis_cache
+from services.enrichment_service import PENDING, PROCESSING, DONE
+
+DEFAULT_CHECKPOINT = ".backfill_ai_checkpoint.json"
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"last_id": 0, "updated": 0, "failed": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: str, checkpoint: dict) -> None:
+    # Write then rename so an interrupted run never leaves a torn file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _missing_ai_content():
+    return or_(Policy.ai_summary.is_(None), Policy.pros.is_(None), Policy.cons.is_(None))
+
+
+# Only fills columns that are still empty; also settles rows enrichment gave up on
+_fill_policy = Policy.__table__.update().where(
+    Policy.__table__.c.id == bindparam("policy_id")
+).values(
+    ai_summary=func.coalesce(Policy.__table__.c.ai_summary, bindparam("summary")),
+    pros=func.coalesce(Policy.__table__.c.pros, bindparam("pros")),
+    cons=func.coalesce(Policy.__table__.c.cons, bindparam("cons")),
+    ai_status=DONE,
+    ai_error=None,
+)
+
+
+def _analyze(policy, limiter: RateLimiter, retries: int):
+    """Analysis for one policy row, or the error after retries run out"""
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return ai_service.request_policy_analysis(policy.title, policy.description, policy.category), None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if attempt < retries:
+                time.sleep(2 ** attempt)
+    return None, error
+
+
+def run_backfill(
+    chunk_size: int = 100,
+    concurrency: int = 4,
+    rate: float = 5.0,
+    retries: int = 2,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    restart: bool = False,
+    limit: int = None,
+):
+    """Generate AI summary / pros / cons for policies that are missing them.
+    
+    Policies are streamed in id order, chunk_size at a time. Each chunk is
+    analyzed by up to `concurrency` threads, no faster than `rate` model
+    calls per second, written in one batch and committed; the last id is then
+    checkpointed so an interrupted run picks up where it stopped.
+    """
+    if not ai_service.AI_AVAILABLE:
+        print("❌ AI is not available (GEMINI_API_KEY missing); nothing to backfill with")
+        return None
+    
+    checkpoint = {"last_id": 0, "updated": 0, "failed": 0} if restart else _load_checkpoint(checkpoint_path)
+    if checkpoint["last_id"]:
+        print(f"↪️ Resuming after policy {checkpoint['last_id']}")
+    
+    limiter = RateLimiter(rate)
+    started = time.monotonic()
+    processed = updated = failed = 0
+    
+    db = SessionLocal()
+    
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while limit is None or processed < limit:
+                size = chunk_size if limit is None else min(chunk_size, limit - processed)
+                
+                # Rows the enrichment pool is handling are left to it
+                chunk = db.execute(
+                    select(Policy.id, Policy.title, Policy.description, Policy.category).where(
+                        Policy.id > checkpoint["last_id"],
+                        _missing_ai_content(),
+                        Policy.ai_status.notin_([PENDING, PROCESSING]),
+                    ).order_by(Policy.id).limit(size)
+                ).all()
+                db.rollback()  # Don't hold a transaction open while the model runs
+                
+                if not chunk:
+                    break
+                
+                results = list(executor.map(lambda policy: _analyze(policy, limiter, retries), chunk))
+                
+                rows = []
+                for policy, (analysis, error) in zip(chunk, results):
+                    if analysis is None:
+                        failed += 1
+                        print(f"❌ Policy {policy.id}: {error}")
+                        continue
+                    rows.append({
+                        "policy_id": policy.id,
+                        "summary": analysis["summary"],
+                        "pros": analysis["pros"],
+                        "cons": analysis["cons"],
+                    })
+                
+                if rows:
+                    db.execute(_fill_policy, rows)
+                db.commit()
+                
+                processed += len(chunk)
+                updated += len(rows)
+                checkpoint.update(
+                    last_id=chunk[-1].id,
+                    updated=checkpoint["updated"] + len(rows),
+                    failed=checkpoint["failed"] + len(chunk) - len(rows),
+                )
+                _save_checkpoint(checkpoint_path, checkpoint)
+                
+                elapsed = time.monotonic() - started
+                print(
+                    f"📦 Up to policy {chunk[-1].id}: {processed} processed, {updated} updated, "
+                    f"{failed} failed ({processed / elapsed:.1f} policies/s)"
+                )
+        
+        elapsed = time.monotonic() - started
+        stats = {
+            "processed": processed,
+            "updated": updated,
+            "failed": failed,
+            "seconds": round(elapsed, 1),
+            "policies_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+            "ai_cache": analysis_cache.stats(),
+            "checkpoint": checkpoint,
+        }
+        print(f"✅ Backfill finished: {processed} processed, {updated} updated, {failed} failed in {elapsed:.1f}s")
+        print(f"📊 AI cache hit rate: {stats['ai_cache']['hit_rate']:.0%}")
+        return stats
+    
+    except KeyboardInterrupt:
+        print(f"\n⏸️ Interrupted; rerun to resume after policy {checkpoint['last_id']}")
+        db.rollback()
+        raise
+    except Exception as e:
+        print(f"❌ Error during backfill: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill in AI summary, pros and cons for existing policies")
+    parser.add_argument("--chunk-size", type=int, default=100, help="policies per batch commit")
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel model calls")
+    parser.add_argument("--rate", type=float, default=5.0, help="max model calls per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=2, help="retries per policy after a failed call")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many policies")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first policy")
+    args = parser.parse_args()
+    
+    print("🤖 Backfilling AI content for policies...")
+    run_backfill(
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+        limit=args.limit,
+    )
@@ -28,12 +28,95 @@ class Settings(BaseSettings):
     EMAIL_FROM: str = "noreply@policyai.com"
     RESEND_API_KEY: str = os.getenv("RESEND_API_KEY", "")
     
+    # Login OTPs
+    OTP_STORE: str = "memory"  # "memory" (single worker) or "postgres" (shared by all workers)
+    OTP_TTL_SECONDS: int = 300
+    OTP_MAX_ATTEMPTS: int = 5  # Wrong guesses before a code is discarded
+    OTP_MEMORY_MAX_ENTRIES: int = 10000
+    OTP_EMAIL_FROM: str = "PolicyAI <onboarding@resend.dev>"  # Default Resend domain
+    OTP_EMAIL_TIMEOUT_SECONDS: float = 10.0
+    
+    # Rate limiting (token buckets: burst size, then refill per minute)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # "memory" (per worker) or "postgres" (shared by all workers)
+    RATE_LIMIT_MEMORY_MAX_KEYS: int = 100000
+    RATE_LIMIT_SEND_OTP_BURST: int = 3  # Per email
+    RATE_LIMIT_SEND_OTP_PER_MINUTE: float = 1.0
+    RATE_LIMIT_SEND_OTP_IP_BURST: int = 20  # Per client IP
+    RATE_LIMIT_SEND_OTP_IP_PER_MINUTE: float = 10.0
+    RATE_LIMIT_VOTE_BURST: int = 30  # Per device
+    RATE_LIMIT_VOTE_PER_MINUTE: float = 60.0
+    RATE_LIMIT_COMMENT_BURST: int = 5  # Per device
+    RATE_LIMIT_COMMENT_PER_MINUTE: float = 10.0
+    
     # App
     PROJECT_NAME: str = "PolicyAI"
     VERSION: str = "1.0.0"
 
     # Gemini AI
     gemini_api_key: Optional[str] = None
+    GEMINI_MODEL: str = "gemini-2.0-flash-exp"
+    
+    # LLM provider: "gemini", or "stub" for offline load tests
+    LLM_PROVIDER: str = "gemini"
+    LLM_STUB_LATENCY_MS: float = 800.0  # Median latency
+    LLM_STUB_LATENCY_SIGMA: float = 0.5  # Lognormal spread; larger = longer tail
+    LLM_STUB_FAILURE_RATE: float = 0.0
+    LLM_STUB_SEED: int = 0
+    
+    # Guards around every model call
+    AI_CALL_TIMEOUT_SECONDS: float = 20.0
+    AI_MAX_CONCURRENT_CALLS: int = 8
+    AI_BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures that open the breaker
+    AI_BREAKER_SLOW_CALL_SECONDS: float = 10.0  # Slower calls count as failures
+    AI_BREAKER_RESET_SECONDS: float = 30.0  # Open time before half-open probes
+    
+    # Push notification fan-out
+    FCM_BATCH_SIZE: int = 500  # Tokens per multicast request (FCM maximum)
+    FCM_TOKEN_CHUNK_SIZE: int = 1000  # Tokens fetched per round trip while streaming recipients
+    FCM_MAX_PARALLEL_BATCHES: int = 4
+    FCM_QUARANTINE_AFTER_FAILURES: int = 3  # Consecutive failed sends before a token is skipped
+    FCM_QUARANTINE_SECONDS: int = 86400
+    FCM_USE_TOPICS: bool = True  # Publish new policies to category topics instead of per-token fan-out
+    FCM_TOPIC_FLUSH_SECONDS: float = 2.0  # Max delay before queued topic subscriptions are sent
+    FCM_TOPIC_RETRY_BACKOFF_SECONDS: float = 5.0  # Doubles with every failed retry, up to 5 minutes
+    
+    # Notification outbox (delivered by the API process and/or notification_worker.py)
+    NOTIFICATION_OUTBOX_BATCH_SIZE: int = 100
+    NOTIFICATION_OUTBOX_POLL_SECONDS: float = 1.0
+    NOTIFICATION_OUTBOX_MAX_ATTEMPTS: int = 5
+    NOTIFICATION_OUTBOX_RETRY_BACKOFF_SECONDS: float = 5.0  # Doubles with every attempt
+    NOTIFICATION_OUTBOX_LEASE_SECONDS: float = 120.0  # Claimed rows are retried after this if the worker dies
+    NOTIFICATION_WORKER_IN_APP: bool = True  # Deliver from the API process; turn off when notification_worker.py runs as its own service
+    
+    # Response cache (feed, single policy and results endpoints)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_SECONDS: float = 30.0
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+    
+    # device_id -> user_id cache
+    IDENTITY_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Event loop lag monitor (opt-in, for load tests); see /health/loop
+    LOOP_MONITOR_ENABLED: bool = False
+    LOOP_MONITOR_THRESHOLD_MS: float = 100.0
+    LOOP_MONITOR_INTERVAL_MS: float = 20.0
+    
+    # Sent as X-Admin-Key to diagnostic endpoints (/health/loop); empty disables them
+    ADMIN_API_KEY: str = ""
+    
+    # Background AI enrichment of new policies
+    AI_ENRICHMENT_WORKERS: int = 4
+    AI_ENRICHMENT_TIMEOUT_SECONDS: float = 30.0
+    AI_ENRICHMENT_MAX_ATTEMPTS: int = 3
+    AI_ENRICHMENT_RETRY_BACKOFF_SECONDS: float = 2.0
+    AI_ENRICHMENT_SWEEP_SECONDS: float = 60.0
+    AI_ENRICHMENT_DEFER_SECONDS: float = 300.0  # Wait after a failed round of attempts; doubles every round
+    AI_ENRICHMENT_MAX_ROUNDS: int = 5  # Failed rounds before a policy is marked failed
+    
+    # Content-addressed cache of AI analyses (memory front + ai_analysis_cache table)
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_MAX_ENTRIES: int = 1024
     
     class Config:
         env_file = ".env"
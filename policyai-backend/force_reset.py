@@ -6,10 +6,15 @@ print("=" * 60)
 
 with engine.connect() as conn:
     try:
+        conn.execute(text("DROP TABLE IF EXISTS policy_vote_tallies CASCADE"))
         conn.execute(text("DROP TABLE IF EXISTS votes CASCADE"))
         conn.execute(text("DROP TABLE IF EXISTS users CASCADE"))
         conn.execute(text("DROP TABLE IF EXISTS policies CASCADE"))
         conn.execute(text("DROP TABLE IF EXISTS comments CASCADE"))
+        conn.execute(text("DROP TABLE IF EXISTS notification_outbox CASCADE"))
+        conn.execute(text("DROP TABLE IF EXISTS otp_codes CASCADE"))
+        conn.execute(text("DROP TABLE IF EXISTS rate_limit_buckets CASCADE"))
+        conn.execute(text("DROP TABLE IF EXISTS fcm_topic_changes CASCADE"))
         conn.commit()
         print("✅ All tables dropped from Railway!")
     except Exception as e:
@@ -22,6 +27,12 @@ from database import Base
 from models.policy import Policy
 from models.user import User
 from models.vote import Vote
+from models.policy_vote_tally import PolicyVoteTally
+from models.ai_analysis_cache import AIAnalysisCache  # Kept across resets, it's content addressed
+from models.notification_outbox import NotificationOutbox
+from models.otp_code import OTPCode
+from models.rate_limit_bucket import RateLimitBucket
+from models.topic_subscription_change import TopicSubscriptionChange
 
 try:
     Base.metadata.create_all(bind=engine)
@@ -1,15 +1,37 @@
 # Force rebuild 2026-01-27 13:29
 
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+import hmac
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 
-from database import Base, engine, get_db, SessionLocal
+from database import Base, engine, async_engine, get_db, SessionLocal, AsyncSessionLocal
 from models.policy import Policy
 from models.user import User
 from models.vote import Vote
 from models.comment import Comment
+from models.policy_vote_tally import PolicyVoteTally
+from models.ai_analysis_cache import AIAnalysisCache
+from models.notification_outbox import NotificationOutbox
+from models.otp_code import OTPCode
+from models.rate_limit_bucket import RateLimitBucket
+from models.topic_subscription_change import TopicSubscriptionChange
+from services.tally_service import backfill_missing_tallies
+from services.response_cache import response_cache
+from services.identity_service import identity_cache
+from services.loop_monitor import loop_monitor, LoopMonitorMiddleware
+from services.enrichment_service import enrichment_pool
+from services.analysis_cache import analysis_cache
+from services.ai_service import PROMPT_VERSION, ai_stats
+from services.notification_dispatcher import notification_dispatcher
+from services.topic_subscriptions import topic_subscriptions
+from services.notification_outbox import outbox_counts, outbox_worker
+from services.otp_store import otp_store
+from services.otp_service import otp_mailer
+from services.rate_limiter import rate_limiter
+from config import settings
 
 # Create app
 app = FastAPI(
@@ -25,14 +47,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Attributes event loop stalls to routes; opt-in as it adds a heartbeat task
+if settings.LOOP_MONITOR_ENABLED:
+    app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
 # Create/Update tables on startup
 # Check if this code exists in main.py:
 
 @app.on_event("startup")
 async def startup_event():
     """Run on application startup"""
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    
     # Create tables
     Base.metadata.create_all(bind=engine)
     
@@ -46,9 +76,38 @@ async def startup_event():
             seed_database()
         else:
             print(f"✅ Database already has {policy_count} policies")
+        
+        # Policies need a tally row to appear in the most_voted feed
+        created = backfill_missing_tallies(db)
+        db.commit()
+        if created:
+            print(f"🧮 Created {created} missing policy vote tallies")
+        
+        # Analyses cached under an older prompt can never be hit again
+        pruned = analysis_cache.prune(PROMPT_VERSION)
+        if pruned:
+            print(f"🧹 Pruned {pruned} AI analyses from older prompt versions")
         db.close()
     except Exception as e:
         print(f"⚠️ Seed check failed: {e}")
+    
+    # Also resumes enrichment left pending by a previous run
+    enrichment_pool.start()
+    topic_subscriptions.start()
+    otp_mailer.start()
+    if settings.NOTIFICATION_WORKER_IN_APP:
+        outbox_worker.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled async connections"""
+    await enrichment_pool.stop()
+    await outbox_worker.stop()
+    await topic_subscriptions.stop()
+    await otp_mailer.stop()
+    await loop_monitor.stop()
+    await async_engine.dispose()
 
 
 # Root endpoint
@@ -65,6 +124,69 @@ def root():
 def health_check():
     return {"status": "ok", "database": "Railway PostgreSQL"}
 
+@app.get("/health/cache")
+def cache_stats():
+    """Hit/miss counters of the response, identity and AI analysis caches"""
+    return {
+        "responses": response_cache.stats(),
+        "identities": identity_cache.stats(),
+        "ai_analyses": analysis_cache.stats(),
+    }
+
+@app.get("/health/ai")
+def ai_health():
+    """LLM provider, in-flight calls and circuit breaker state"""
+    return ai_stats()
+
+@app.get("/health/enrichment")
+def enrichment_stats():
+    """Queue depth and outcome counters of the AI enrichment pool"""
+    return enrichment_pool.stats()
+
+@app.get("/health/notifications")
+def notification_stats():
+    """Push notification fan-out counters, recent runs and topic subscriptions"""
+    return {
+        **notification_dispatcher.stats(),
+        "topic_subscriptions": topic_subscriptions.stats(),
+    }
+
+@app.get("/health/outbox")
+async def outbox_stats():
+    """Notification outbox backlog per status, plus this process's worker counters"""
+    async with AsyncSessionLocal() as db:
+        counts = await outbox_counts(db)
+    return {"rows": counts, "worker": outbox_worker.stats()}
+
+@app.get("/health/otp")
+def otp_stats():
+    """OTP store backend and counters, and OTP email delivery, for this process"""
+    return {**otp_store.stats(), "email": otp_mailer.stats()}
+
+@app.get("/health/ratelimit")
+def rate_limit_stats():
+    """Allowed / rejected requests per rate limit policy in this process"""
+    return rate_limiter.stats()
+
+def require_loop_monitor_admin(x_admin_key: Optional[str] = Header(None)):
+    """Loop stats include stack traces: only served while the monitor is
+    enabled, and only to callers presenting ADMIN_API_KEY"""
+    if not settings.LOOP_MONITOR_ENABLED:
+        raise HTTPException(status_code=404, detail="Loop monitor is disabled")
+    if not settings.ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+@app.get("/health/loop", dependencies=[Depends(require_loop_monitor_admin)])
+def loop_stats():
+    """Event loop stalls over the threshold, worst routes first"""
+    return loop_monitor.stats()
+
+@app.post("/health/loop/reset", dependencies=[Depends(require_loop_monitor_admin)])
+def reset_loop_stats():
+    """Clear recorded stalls, e.g. between load test runs"""
+    loop_monitor.reset()
+    return {"message": "Loop monitor stats cleared"}
+
 # Import routers
 from routers import auth, comment, policies, users, votes  # noqa: E402
 
@@ -2,5 +2,11 @@ from models.policy import Policy
 from models.user import User
 from models.vote import Vote
 from models.comment import Comment  # ✅ ADD THIS
+from models.policy_vote_tally import PolicyVoteTally
+from models.ai_analysis_cache import AIAnalysisCache
+from models.notification_outbox import NotificationOutbox
+from models.otp_code import OTPCode
+from models.rate_limit_bucket import RateLimitBucket
+from models.topic_subscription_change import TopicSubscriptionChange
 
-__all__ = ['Policy', 'User', 'Vote', 'Comment']  # ✅ ADD Comment
+__all__ = ['Policy', 'User', 'Vote', 'Comment', 'PolicyVoteTally', 'AIAnalysisCache', 'NotificationOutbox', 'OTPCode', 'RateLimitBucket', 'TopicSubscriptionChange']  # ✅ ADD Comment
@@ -0,0 +1,25 @@
+from sqlalchemy import ARRAY, Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from database import Base
+
+
+class AIAnalysisCache(Base):
+    """Model output for a policy's content, addressed by a hash of its inputs.
+    
+    The key covers the normalized title, description and category plus the
+    prompt version and model name, so a prompt or model change never reuses
+    an old answer.
+    """
+    __tablename__ = "ai_analysis_cache"
+    __table_args__ = (
+        Index('ix_ai_analysis_cache_prompt_version', 'prompt_version'),  # Pruning superseded prompts
+        {'extend_existing': True}
+    )
+    
+    key = Column(String(64), primary_key=True)  # sha256 hex digest
+    prompt_version = Column(Integer, nullable=False)
+    model = Column(String(100), nullable=False)
+    summary = Column(Text, nullable=False)
+    pros = Column(ARRAY(Text), nullable=False)
+    cons = Column(ARRAY(Text), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
 
 class Comment(Base):
     __tablename__ = "comments"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index('ix_comments_policy_created_at', 'policy_id', 'created_at', 'id'),  # Paginated thread listing
+        {'extend_existing': True}
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     policy_id = Column(Integer, ForeignKey('policies.id', ondelete='CASCADE'), nullable=False)
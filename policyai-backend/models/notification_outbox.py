@@ -0,0 +1,34 @@
+from sqlalchemy import JSON, Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from database import Base
+
+
+class NotificationOutbox(Base):
+    """A notification waiting to be sent, written in the same transaction as
+    the change that triggers it.
+    
+    The outbox worker (in the API process, or notification_worker.py) claims
+    due rows, sends them and marks them sent, or schedules a retry in
+    next_attempt_at. dedupe_key is unique, so the same notification can only
+    be queued once.
+    """
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),  # Worker claims
+        {'extend_existing': True}
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dedupe_key = Column(String(255), unique=True, nullable=False)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)  # title, body, data and optional topic
+    
+    # pending -> processing -> sent | failed; processing rows whose lease
+    # (next_attempt_at) ran out are claimed again
+    status = Column(String(20), default="pending", server_default="pending", nullable=False)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
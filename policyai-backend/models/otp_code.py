@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+from database import Base
+
+
+class OTPCode(Base):
+    """The outstanding login OTP for an email, shared by every API worker.
+    
+    Only a keyed hash of the code is stored. attempts counts wrong guesses;
+    the code is consumed by the first correct one.
+    """
+    __tablename__ = "otp_codes"
+    __table_args__ = (
+        Index('ix_otp_codes_expires_at', 'expires_at'),  # Pruning expired codes
+        {'extend_existing': True}
+    )
+    
+    email = Column(String(255), primary_key=True)
+    code_hash = Column(String(64), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
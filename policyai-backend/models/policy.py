@@ -1,4 +1,4 @@
-from sqlalchemy import ARRAY, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import ARRAY, Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -6,7 +6,18 @@ from database import Base
 
 class Policy(Base):
     __tablename__ = "policies"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Keyset pagination of the feed (newest / ending_soon, optionally by category)
+        Index('ix_policies_active_created_at', 'is_active', 'created_at', 'id'),
+        Index('ix_policies_active_ends_at', 'is_active', 'ends_at', 'id'),
+        Index('ix_policies_category_created_at', 'category', 'is_active', 'created_at', 'id'),
+        Index('ix_policies_category_ends_at', 'category', 'is_active', 'ends_at', 'id'),
+        # Enrichment worker sweeps for pending / stuck rows
+        Index('ix_policies_ai_status', 'ai_status', 'updated_at'),
+        # A retried create with the same Idempotency-Key finds the first policy
+        Index('ix_policies_idempotency_key', 'idempotency_key', unique=True),
+        {'extend_existing': True}
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -18,11 +29,19 @@ class Policy(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     ends_at = Column(DateTime(timezone=True), nullable=True)
+    idempotency_key = Column(String(255), nullable=True)  # Idempotency-Key of the creating request
 
     pros = Column(ARRAY(Text), nullable=True)  # Array of pros
     cons = Column(ARRAY(Text), nullable=True) # Array of cons
     
+    # AI enrichment of summary/pros/cons: pending -> processing -> done | failed
+    ai_status = Column(String(20), nullable=False, default="done", server_default="done")
+    ai_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    ai_error = Column(Text, nullable=True)
+    ai_next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # A deferred pending row waits until then
+    
     # Relationships - ADD ALL THREE!
     author = relationship("User", back_populates="policies")  # ← ADD THIS!
     votes = relationship("Vote", back_populates="policy", cascade="all, delete-orphan")  # ← ADD THIS!
     comments = relationship("Comment", back_populates="policy", cascade="all, delete-orphan")
+    tally = relationship("PolicyVoteTally", back_populates="policy", uselist=False, cascade="all, delete-orphan")
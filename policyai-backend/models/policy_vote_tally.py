@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from database import Base
+
+
+class PolicyVoteTally(Base):
+    """Running vote counts per policy, kept in step with the votes table"""
+    __tablename__ = "policy_vote_tallies"
+    __table_args__ = (
+        Index('ix_policy_vote_tallies_total_votes', 'total_votes', 'policy_id'),  # most_voted feed sort
+        {'extend_existing': True}
+    )
+    
+    policy_id = Column(Integer, ForeignKey("policies.id", ondelete="CASCADE"), primary_key=True)
+    support_count = Column(Integer, default=0, server_default="0", nullable=False)
+    oppose_count = Column(Integer, default=0, server_default="0", nullable=False)
+    neutral_count = Column(Integer, default=0, server_default="0", nullable=False)
+    total_votes = Column(Integer, default=0, server_default="0", nullable=False)
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # Bumped on every change, feeds ETags
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    policy = relationship("Policy", back_populates="tally")
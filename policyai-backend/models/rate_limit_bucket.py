@@ -0,0 +1,22 @@
+from sqlalchemy import Boolean, Column, Float, String, DateTime, Index
+from sqlalchemy.sql import func
+from database import Base
+
+
+class RateLimitBucket(Base):
+    """Token bucket shared by every API worker, one row per (policy, client).
+    
+    tokens is the level as of updated_at; refills are computed on the next
+    request rather than written on a timer. allowed is the outcome of the
+    latest request, returned by the same statement that took the token.
+    """
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = (
+        Index('ix_rate_limit_buckets_updated_at', 'updated_at'),  # Pruning idle buckets
+        {'extend_existing': True}
+    )
+    
+    key = Column(String(512), primary_key=True)  # "<policy>:<device id / email / ip>"
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, default=True, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,20 @@
+from sqlalchemy import Boolean, Column, String, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+
+class TopicSubscriptionChange(Base):
+    """A topic (un)subscription FCM hasn't confirmed yet.
+    
+    Written in the same transaction as the users row change that calls for
+    it and deleted once FCM answered, so changes still queued in memory when
+    a process stops are replayed by the next one. One row per (token, topic)
+    holding the latest wanted state.
+    """
+    __tablename__ = "fcm_topic_changes"
+    __table_args__ = {'extend_existing': True}
+    
+    token = Column(String(500), primary_key=True)
+    topic = Column(String(255), primary_key=True)
+    subscribe = Column(Boolean, nullable=False)  # False to unsubscribe
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime
+from sqlalchemy import ARRAY, Column, Integer, String, Text, Boolean, DateTime, or_
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship 
 from database import Base
@@ -34,11 +34,19 @@ class User(Base):
     is_email_verified = Column(Boolean, default=False, nullable=False)
     
     # Tokens
-    fcm_token = Column(String(500), nullable=True)
+    fcm_token = Column(String(500), nullable=True, index=True)
+    fcm_failure_count = Column(Integer, default=0, server_default="0", nullable=False)  # Consecutive failed sends
+    fcm_quarantined_until = Column(DateTime(timezone=True), nullable=True)  # Skipped by broadcasts until then
+    notification_categories = Column(ARRAY(String(100)), nullable=True)  # None = notify for every category
     
     # Login tracking
     last_login = Column(DateTime(timezone=True), nullable=True)
 
+    @classmethod
+    def fcm_token_usable(cls):
+        """Filter for tokens that aren't quarantined"""
+        return or_(cls.fcm_quarantined_until.is_(None), cls.fcm_quarantined_until <= func.now())
+
     policies = relationship("Policy", back_populates="author", cascade="all, delete-orphan")
     votes = relationship("Vote", back_populates="user", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan")
\ No newline at end of file
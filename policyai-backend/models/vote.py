@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -19,5 +19,6 @@ class Vote(Base):
     
     __table_args__ = (
         UniqueConstraint('user_id', 'policy_id', name='uq_user_policy_vote'),
+        Index('ix_votes_policy_id_stance', 'policy_id', 'stance'),  # Per-policy vote aggregation
         {'extend_existing': True}
     )
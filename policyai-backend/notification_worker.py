@@ -0,0 +1,26 @@
+import asyncio
+from database import async_engine
+import models  # noqa: F401 - register all mappers
+from services.notification_outbox import outbox_worker
+
+
+async def main():
+    """Deliver queued notifications until interrupted.
+    
+    Run as its own process (python notification_worker.py) next to the API,
+    with NOTIFICATION_WORKER_IN_APP=false on the API to keep delivery off
+    the request workers; several copies can run at once, they never claim the
+    same rows.
+    """
+    try:
+        await outbox_worker.run()
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    print("📬 Notification outbox worker starting...")
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print(f"\n⏹️ Stopped: {outbox_worker.stats()}")
@@ -0,0 +1,39 @@
+import sys
+from database import SessionLocal
+import models  # noqa: F401 - register all mappers
+from services.tally_service import reconcile_tallies
+
+def run_reconciliation(apply: bool = True):
+    """Rebuild policy_vote_tallies from the votes table and report drift"""
+    
+    db = SessionLocal()
+    
+    try:
+        drift = reconcile_tallies(db, apply=apply)
+        
+        if not drift:
+            print("✅ All policy tallies match the votes table")
+        
+        for item in drift:
+            print(f"⚠️ Policy {item['policy_id']}: stored={item['stored']} actual={item['actual']}")
+        
+        if apply:
+            db.commit()
+            if drift:
+                print(f"✅ Rebuilt {len(drift)} policy tallies")
+        else:
+            db.rollback()
+            print(f"🔍 Dry run: {len(drift)} policy tallies drifted, nothing written")
+        
+        return drift
+        
+    except Exception as e:
+        print(f"❌ Error reconciling tallies: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("🧮 Reconciling policy vote tallies...")
+    run_reconciliation(apply="--dry-run" not in sys.argv)
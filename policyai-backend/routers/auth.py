@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 import jwt
 from jwt import PyJWTError as JWTError
@@ -7,9 +8,10 @@ from pydantic import BaseModel, EmailStr
 from typing import Optional
 import uuid
 from models.user import User
-from database import get_db
+from database import get_async_db
 from config import settings
 from services.otp_service import generate_otp, store_otp, verify_otp, send_otp_email
+from services.rate_limiter import rate_limiter, client_ip
 
 
 
@@ -73,33 +75,39 @@ class UserUpdate(BaseModel):
 
 
 @router.post("/email/send-otp")
-async def send_email_otp(request: EmailOTPRequest, db: Session = Depends(get_db)):
+async def send_email_otp(
+    request: EmailOTPRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+):
     """Send OTP to email"""
     
+    # One key per address for both the rate limit and the OTP store
+    email = request.email.strip().lower()
+    
+    # Every OTP is an outbound email; limit per address and per client
+    await rate_limiter.enforce("send_otp_ip", client_ip(http_request))
+    await rate_limiter.enforce("send_otp_email", email)
+    
     try:
         # Generate 6-digit OTP
         otp = generate_otp()
         
         # Store OTP with 5-minute expiry
-        store_otp(request.email, otp)
+        await store_otp(email, otp)
         
-        # Send email via Resend
-        email_sent = await send_otp_email(request.email, otp)
+        # Emailed after the response is sent; the OTP is already usable
+        background_tasks.add_task(send_otp_email, request.email, otp)
         
-        if email_sent:
-            return {
-                "success": True,
-                "message": f"OTP sent to {request.email}",
-                "email": request.email,
-                "expires_in": "5 minutes",
-                # Remove in production for security!
-                "mock_otp": otp  # Only for testing
-            }
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to send OTP email"
-            )
+        return {
+            "success": True,
+            "message": f"OTP sent to {request.email}",
+            "email": request.email,
+            "expires_in": "5 minutes",
+            # Remove in production for security!
+            "mock_otp": otp  # Only for testing
+        }
     
     except Exception as e:
         print(f"❌ Error in send_email_otp: {str(e)}")
@@ -111,18 +119,18 @@ async def send_email_otp(request: EmailOTPRequest, db: Session = Depends(get_db)
 
 
 @router.post("/email/verify-otp", response_model=Token)
-async def verify_email_otp(request: EmailOTPVerify, db: Session = Depends(get_db)):
+async def verify_email_otp(request: EmailOTPVerify, db: AsyncSession = Depends(get_async_db)):
     """Verify email OTP and return JWT token"""
     
-    # Verify OTP
-    if not verify_otp(request.email, request.otp):
+    # Verify OTP; stored under the address send_email_otp normalized
+    if not await verify_otp(request.email.strip().lower(), request.otp):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired OTP"
         )
     
     # Find or create user
-    user = db.query(User).filter(User.email == request.email).first()
+    user = (await db.execute(select(User).where(User.email == request.email))).scalars().first()
     
     if not user:
         # ✅ Generate ALL required fields
@@ -142,14 +150,14 @@ async def verify_email_otp(request: EmailOTPVerify, db: Session = Depends(get_db
             last_login=datetime.utcnow()
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         print(f"✅ New user created: {user.email} (ID: {user.id}, device_id: {device_id})")
     else:
         # Update existing user
         user.last_login = datetime.utcnow()
         user.is_email_verified = True
-        db.commit()
+        await db.commit()
         print(f"✅ User logged in: {user.email}")
     
     # Create JWT token
@@ -177,7 +185,7 @@ async def verify_email_otp(request: EmailOTPVerify, db: Session = Depends(get_db
 
 
 @router.post("/google/signin", response_model=Token)
-async def google_sign_in(request: GoogleSignIn, db: Session = Depends(get_db)):
+async def google_sign_in(request: GoogleSignIn, db: AsyncSession = Depends(get_async_db)):
     """
     Sign in with Google
     Phase 1: Mock implementation
@@ -208,7 +216,7 @@ async def google_sign_in(request: GoogleSignIn, db: Session = Depends(get_db)):
         )
     
     # Find or create user
-    user = db.query(User).filter(User.email == request.email).first()
+    user = (await db.execute(select(User).where(User.email == request.email))).scalars().first()
     
     if not user:
         # ✅ Generate ALL required fields
@@ -230,8 +238,8 @@ async def google_sign_in(request: GoogleSignIn, db: Session = Depends(get_db)):
             last_login=datetime.utcnow()
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         print(f"✅ New Google user created: {user.email} (ID: {user.id})")
     else:
         # Update existing user
@@ -239,7 +247,7 @@ async def google_sign_in(request: GoogleSignIn, db: Session = Depends(get_db)):
         user.name = request.name or user.name
         user.avatar_url = request.avatar_url or user.avatar_url
         user.auth_provider = "google"
-        db.commit()
+        await db.commit()
         print(f"✅ Google user logged in: {user.email}")
     
     # Create JWT token
@@ -268,14 +276,14 @@ async def google_sign_in(request: GoogleSignIn, db: Session = Depends(get_db)):
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     # TODO: Add JWT token dependency for authentication
     # current_user: User = Depends(get_current_user_from_token)
 ):
     """Get current user info"""
     
     # Mock: Return first user (replace with real auth later)
-    user = db.query(User).first()
+    user = (await db.execute(select(User).limit(1))).scalars().first()
     
     if not user:
         raise HTTPException(
@@ -292,11 +300,11 @@ async def get_current_user(
 
 
 @router.get("/me/profile")
-async def get_user_profile(db: Session = Depends(get_db)):
+async def get_user_profile(db: AsyncSession = Depends(get_async_db)):
     """Get current user's complete profile"""
     
     # TODO: Get user from JWT token
-    user = db.query(User).first()
+    user = (await db.execute(select(User).limit(1))).scalars().first()
     
     if not user:
         raise HTTPException(
@@ -329,13 +337,13 @@ async def get_user_profile(db: Session = Depends(get_db)):
 @router.put("/me/update")
 async def update_user_profile(
     user_update: UserUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user's profile (name, bio, avatar)"""
     
     # TODO: Get user from JWT token
     # For now, get first user (mock)
-    user = db.query(User).first()
+    user = (await db.execute(select(User).limit(1))).scalars().first()
     
     if not user:
         raise HTTPException(
@@ -357,8 +365,8 @@ async def update_user_profile(
     if hasattr(user, 'updated_at'):
         user.updated_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     print(f"✅ Profile updated for user: {user.email}")
     
@@ -1,52 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import func, delete, desc, tuple_, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from datetime import datetime
+from database import get_async_db
 from models.comment import Comment
 from models.user import User
 from models.policy import Policy
 from schemas.comment import CommentCreate, CommentResponse, CommentStats
+from services.pagination import encode_cursor, decode_cursor
+from services.etag import make_etag, etag_matches, not_modified
+from services.identity_service import resolve_user_id, default_user_name
+from services.rate_limiter import rate_limiter
 
 router = APIRouter()
 
 # ========== ADD COMMENT ==========
 @router.post("/policies/{policy_id}/comments", response_model=CommentResponse)
-def add_comment(
+async def add_comment(
     policy_id: int,
     comment_data: CommentCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Add a comment to a policy"""
     
-    # Check if policy exists
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
+    await rate_limiter.enforce("comment", comment_data.device_id)
+    
+    user_id = await resolve_user_id(db, comment_data.device_id)
+    
+    # Inserting from policies doubles as the existence check, and the author's
+    # name comes back in the same round trip
+    new_comment = (await db.execute(
+        insert(Comment).from_select(
+            ["policy_id", "user_id", "text"],
+            select(Policy.id, literal(user_id), literal(comment_data.text)).where(Policy.id == policy_id),
+        ).returning(
+            Comment.id,
+            Comment.policy_id,
+            Comment.user_id,
+            Comment.text,
+            Comment.created_at,
+            select(User.name).where(User.id == user_id).scalar_subquery().label("user_name"),
+        )
+    )).first()
+    
+    if new_comment is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Policy not found")
     
-    # Get or create user
-    user = db.query(User).filter(User.device_id == comment_data.device_id).first()
-    if not user:
-        user = User(device_id=comment_data.device_id, name=f"User_{comment_data.device_id[:8]}")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    
-    # Create comment
-    new_comment = Comment(
-        policy_id=policy_id,
-        user_id=user.id,
-        text=comment_data.text
-    )
-    
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.commit()
     
     return CommentResponse(
         id=new_comment.id,
         policy_id=new_comment.policy_id,
         user_id=new_comment.user_id,
-        user_name=user.name or f"User_{user.device_id[:8]}",
+        user_name=new_comment.user_name or default_user_name(comment_data.device_id),
         text=new_comment.text,
         created_at=new_comment.created_at,
         is_own=True
@@ -55,93 +63,128 @@ def add_comment(
 
 # ========== GET COMMENTS ==========
 @router.get("/policies/{policy_id}/comments")
-def get_comments(
+async def get_comments(
     policy_id: int,
+    request: Request,
+    response: Response,
     device_id: str = Query(...),
-    sort: str = Query("newest", regex="^(newest|oldest)$"),
-    db: Session = Depends(get_db)
+    sort: str = Query("newest", pattern="^(newest|oldest)$"),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all comments for a policy"""
-    
-    # Check if policy exists
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
-        raise HTTPException(status_code=404, detail="Policy not found")
-    
-    # Get current user
-    current_user = db.query(User).filter(User.device_id == device_id).first()
-    
-    # Query comments with user data
-    query = db.query(Comment, User).join(
-        User, Comment.user_id == User.id
-    ).filter(
-        Comment.policy_id == policy_id
-    )
-    
-    # Sort
-    if sort == "newest":
-        query = query.order_by(desc(Comment.created_at))
-    else:
-        query = query.order_by(Comment.created_at)
-    
-    comments = query.all()
+    """Get a page of comments for a policy.
+    
+    Keyset paginated on (created_at, id); pass next_cursor back as cursor to
+    fetch the following page.
+    """
+    
+    after = decode_cursor(cursor, sort, key_types=(datetime, int))
+    
+    async def comment_page(query):
+        query = query.join(
+            User, Comment.user_id == User.id
+        ).filter(
+            Comment.policy_id == policy_id
+        )
+        
+        # Sort
+        if sort == "newest":
+            if after:
+                query = query.filter(tuple_(Comment.created_at, Comment.id) < tuple_(*after))
+            query = query.order_by(desc(Comment.created_at), desc(Comment.id))
+        else:
+            if after:
+                query = query.filter(tuple_(Comment.created_at, Comment.id) > tuple_(*after))
+            query = query.order_by(Comment.created_at, Comment.id)
+        
+        return (await db.execute(query.limit(limit + 1))).all()
+    
+    # Revalidate against comment ids and author versions before loading text
+    versions = await comment_page(select(Comment.id, User.updated_at))
+    etag = make_etag("comments", policy_id, device_id, sort, cursor, limit, [tuple(row) for row in versions])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    
+    # Only the columns the response needs; is_own is computed by the database
+    comments = await comment_page(select(
+        Comment.id,
+        Comment.policy_id,
+        Comment.user_id,
+        func.coalesce(User.name, "User_" + func.substr(User.device_id, 1, 8)).label("user_name"),
+        Comment.text,
+        Comment.created_at,
+        (User.device_id == device_id).label("is_own"),
+    ))
+    
+    # An empty first page is the only case where the policy may not exist
+    if not comments and not after:
+        if (await db.execute(select(Policy.id).where(Policy.id == policy_id))).first() is None:
+            raise HTTPException(status_code=404, detail="Policy not found")
+    
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        next_cursor = encode_cursor(sort, [comments[-1].created_at, comments[-1].id])
     
     # Format response
     result = []
-    for comment, user in comments:
+    for comment in comments:
         result.append({
             "id": comment.id,
             "policy_id": comment.policy_id,
             "user_id": comment.user_id,
-            "user_name": user.name or f"User_{user.device_id[:8]}",
+            "user_name": comment.user_name,
             "text": comment.text,
             "created_at": comment.created_at.isoformat(),
-            "is_own": current_user and comment.user_id == current_user.id
+            "is_own": comment.is_own
         })
     
     return {
         "comments": result,
-        "total": len(result)
+        "total": len(result),
+        "next_cursor": next_cursor
     }
 
 
 # ========== DELETE COMMENT ==========
 @router.delete("/comments/{comment_id}")
-def delete_comment(
+async def delete_comment(
     comment_id: int,
     device_id: str = Query(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a comment (only own comments)"""
     
     # Get user
-    user = db.query(User).filter(User.device_id == device_id).first()
-    if not user:
+    user_id = await resolve_user_id(db, device_id, create=False)
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get comment
-    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+    # Get comment author
+    comment = (await db.execute(select(Comment.user_id).where(Comment.id == comment_id))).first()
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
     # Check ownership
-    if comment.user_id != user.id:
+    if comment.user_id != user_id:
         raise HTTPException(status_code=403, detail="You can only delete your own comments")
     
-    db.delete(comment)
-    db.commit()
+    await db.execute(delete(Comment).where(Comment.id == comment_id))
+    await db.commit()
     
     return {"success": True, "message": "Comment deleted"}
 
 
 # ========== GET COMMENT COUNT ==========
 @router.get("/policies/{policy_id}/comments/count", response_model=CommentStats)
-def get_comment_count(policy_id: int, db: Session = Depends(get_db)):
+async def get_comment_count(policy_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get comment count for a policy"""
     
-    count = db.query(func.count(Comment.id)).filter(
-        Comment.policy_id == policy_id
-    ).scalar()
+    count = (await db.execute(
+        select(func.count(Comment.id)).where(Comment.policy_id == policy_id)
+    )).scalar()
     
     return CommentStats(
         policy_id=policy_id,
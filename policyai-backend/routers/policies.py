@@ -1,93 +1,65 @@
 # Force update 2026-01-27
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime, timezone  
 from models.policy import Policy
-from models.vote import Vote
-from models.user import User
-from schemas.policy import PolicyResponse, PolicyCreate, PolicyWithStats
-from database import get_db
-from services.fcm_service import send_new_policy_notification
-from services.ai_service import generate_policy_summary, analyze_policy_pros_cons
+from models.policy_vote_tally import PolicyVoteTally
+from schemas.policy import PolicyResponse, PolicyCreate, PolicyWithStats, PolicyEnrichmentStatus
+from database import get_async_db
+from services.notification_outbox import enqueue_new_policy
+from services.enrichment_service import enrichment_pool, PENDING
+from services.pagination import encode_cursor, decode_cursor
+from services.response_cache import response_cache, invalidate_feed
+from services.etag import make_etag, etag_matches, not_modified
+from services.identity_service import resolve_user_id
 
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[PolicyWithStats])
-
-def get_policies(db: Session = Depends(get_db)):
-    """Get all active policies with voting stats"""
+def _time_left(ends_at) -> str:
+    """Human readable time remaining until voting closes"""
+    if not ends_at:
+        return "No deadline"
     
-    policies = db.query(Policy).filter(Policy.is_active == True).all()
-    
-    result = []
-    for policy in policies:
-        votes = db.query(Vote).filter(Vote.policy_id == policy.id).all()
-        total_votes = len(votes)
-        support_votes = len([v for v in votes if v.stance == "support"])
-        oppose_votes = len([v for v in votes if v.stance == "oppose"])
-        
-        support_percentage = int((support_votes / total_votes * 100)) if total_votes > 0 else 0
-        oppose_percentage = int((oppose_votes / total_votes * 100)) if total_votes > 0 else 0
-        
-        # Calculate time left
-        if policy.ends_at:
-            now = datetime.now(timezone.utc)
-            days_left = (policy.ends_at - now).days
-            time_left = f"{days_left} days left" if days_left > 0 else "Ended"
-        else:
-            time_left = "No deadline"
-        
-        # Build response with all fields including pros/cons
-        policy_dict = {
-            "id": policy.id,
-            "title": policy.title,
-            "description": policy.description,
-            "category": policy.category,
-            "author_id": policy.author_id,
-            "ai_summary": policy.ai_summary,
-            "pros": policy.pros if policy.pros else [],
-            "cons": policy.cons if policy.cons else [],
-            "is_active": policy.is_active,
-            "created_at": policy.created_at,
-            "ends_at": policy.ends_at,
-            "updated_at": policy.updated_at if hasattr(policy, 'updated_at') else None,
-            "support_percentage": support_percentage,
-            "oppose_percentage": oppose_percentage,
-            "total_votes": total_votes,
-            "time_left": time_left
-        }
-        result.append(policy_dict)
-    
-    return result
+    days_left = (ends_at - datetime.now(timezone.utc)).days
+    return f"{days_left} days left" if days_left > 0 else "Ended"
 
 
-@router.get("/{policy_id}", response_model=PolicyWithStats)
-def get_policy(policy_id: int, db: Session = Depends(get_db)):
-    """Get single policy by ID with voting stats"""
-    
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
-        raise HTTPException(status_code=404, detail="Policy not found")
-    
-    votes = db.query(Vote).filter(Vote.policy_id == policy.id).all()
-    total_votes = len(votes)
-    support_votes = len([v for v in votes if v.stance == "support"])
-    oppose_votes = len([v for v in votes if v.stance == "oppose"])
+def _policies_with_stats():
+    """Select policies together with their vote counts in a single round trip.
     
+    Counts come from the incrementally maintained policy_vote_tallies row, so
+    reading stats costs one joined row per policy regardless of vote volume.
+    The tally version comes along for the ETag.
+    """
+    return select(
+        Policy,
+        func.coalesce(PolicyVoteTally.total_votes, 0).label("total_votes"),
+        func.coalesce(PolicyVoteTally.support_count, 0).label("support_votes"),
+        func.coalesce(PolicyVoteTally.oppose_count, 0).label("oppose_votes"),
+        PolicyVoteTally.version,
+    ).outerjoin(
+        PolicyVoteTally, PolicyVoteTally.policy_id == Policy.id
+    )
+
+
+def _version_etag(*parts, rows) -> str:
+    """ETag over policy-with-stats rows; time_left is included as it changes daily"""
+    return make_etag(*parts, [
+        (row.Policy.id, row.Policy.updated_at, row.version, _time_left(row.Policy.ends_at))
+        for row in rows
+    ])
+
+
+def _policy_with_stats_dict(policy: Policy, total_votes: int, support_votes: int, oppose_votes: int) -> dict:
+    """Build the PolicyWithStats payload for a policy and its vote counts"""
     support_percentage = int((support_votes / total_votes * 100)) if total_votes > 0 else 0
     oppose_percentage = int((oppose_votes / total_votes * 100)) if total_votes > 0 else 0
     
-    # Calculate time left
-    if policy.ends_at:
-        now = datetime.now(timezone.utc)
-        days_left = (policy.ends_at - now).days
-        time_left = f"{days_left} days left" if days_left > 0 else "Ended"
-    else:
-        time_left = "No deadline"
-    
     return {
         "id": policy.id,
         "title": policy.title,
@@ -104,65 +76,204 @@ def get_policy(policy_id: int, db: Session = Depends(get_db)):
         "support_percentage": support_percentage,
         "oppose_percentage": oppose_percentage,
         "total_votes": total_votes,
-        "time_left": time_left
+        "time_left": _time_left(policy.ends_at),
+        "ai_status": policy.ai_status
     }
 
 
+def _apply_feed_sort(query, sort: str, after: Optional[list]):
+    """Order the feed by a keyset (ending in id) and skip past the cursor position"""
+    if sort == "most_voted":
+        query = query.filter(PolicyVoteTally.policy_id.isnot(None))
+        if after:
+            query = query.filter(tuple_(PolicyVoteTally.total_votes, PolicyVoteTally.policy_id) < tuple_(*after))
+        return query.order_by(PolicyVoteTally.total_votes.desc(), PolicyVoteTally.policy_id.desc())
+    
+    if sort == "ending_soon":
+        query = query.filter(Policy.ends_at.isnot(None), Policy.ends_at > func.now())
+        if after:
+            query = query.filter(tuple_(Policy.ends_at, Policy.id) > tuple_(*after))
+        return query.order_by(Policy.ends_at.asc(), Policy.id.asc())
+    
+    if after:
+        query = query.filter(tuple_(Policy.created_at, Policy.id) < tuple_(*after))
+    return query.order_by(Policy.created_at.desc(), Policy.id.desc())
+
+
+def _feed_sort_key(sort: str, policy: Policy, total_votes: int) -> list:
+    """Keyset values of a feed row, used to build the next-page cursor"""
+    if sort == "most_voted":
+        return [total_votes, policy.id]
+    if sort == "ending_soon":
+        return [policy.ends_at, policy.id]
+    return [policy.created_at, policy.id]
+
+
+@router.get("/", response_model=List[PolicyWithStats])
+
+async def get_policies(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    sort: str = Query("newest", pattern="^(newest|ending_soon|most_voted)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a page of active policies with voting stats.
+    
+    Pages are keyset paginated: when more rows exist the X-Next-Cursor header
+    carries the cursor to pass back for the following page.
+    """
+    
+    after = decode_cursor(cursor, sort, key_types=(int, int) if sort == "most_voted" else (datetime, int))
+    
+    async def feed_page(query):
+        query = query.filter(Policy.is_active == True)
+        if category:
+            query = query.filter(Policy.category == category)
+        return (await db.execute(_apply_feed_sort(query, sort, after).limit(limit + 1))).all()
+    
+    async def load_page():
+        rows = await feed_page(_policies_with_stats())
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(sort, _feed_sort_key(sort, last.Policy, last.total_votes))
+        
+        etag = _version_etag("feed", category, sort, cursor, limit, rows=rows)
+        items = [
+            _policy_with_stats_dict(policy, total_votes, support_votes, oppose_votes)
+            for policy, total_votes, support_votes, oppose_votes, _ in rows
+        ]
+        return etag, items, next_cursor
+    
+    # The ETag is cached with the page, so a hit answers If-None-Match without the database
+    etag, items, next_cursor = await response_cache.get_or_load(("feed", category, sort, cursor, limit), load_page)
+    
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    if etag_matches(request, etag):
+        return not_modified(etag, headers)
+    
+    response.headers["ETag"] = etag
+    response.headers.update(headers or {})
+    
+    return items
+
+
+@router.get("/{policy_id}", response_model=PolicyWithStats)
+async def get_policy(policy_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Get single policy by ID with voting stats"""
+    
+    async def load_policy():
+        row = (await db.execute(_policies_with_stats().filter(Policy.id == policy_id))).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Policy not found")
+        
+        policy, total_votes, support_votes, oppose_votes, _ = row
+        return _version_etag("policy", rows=[row]), _policy_with_stats_dict(policy, total_votes, support_votes, oppose_votes)
+    
+    etag, payload = await response_cache.get_or_load(("policy", policy_id), load_policy)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    response.headers["ETag"] = etag
+    return payload
+
+
+@router.get("/{policy_id}/enrichment", response_model=PolicyEnrichmentStatus)
+async def get_policy_enrichment(policy_id: int, db: AsyncSession = Depends(get_async_db)):
+    """AI enrichment status of a policy"""
+    
+    row = (await db.execute(
+        select(
+            Policy.id, Policy.ai_status, Policy.ai_attempts, Policy.ai_error, Policy.ai_next_attempt_at
+        ).where(Policy.id == policy_id)
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Policy not found")
+    
+    return PolicyEnrichmentStatus(
+        policy_id=row.id,
+        status=row.ai_status,
+        attempts=row.ai_attempts,
+        error=row.ai_error,
+        next_attempt_at=row.ai_next_attempt_at
+    )
+
+
+@router.post("/{policy_id}/enrichment/retry", response_model=PolicyEnrichmentStatus)
+async def retry_policy_enrichment(policy_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Re-enqueue a policy whose AI enrichment failed"""
+    
+    if not await enrichment_pool.requeue_failed(policy_id):
+        exists = (await db.execute(select(Policy.id).where(Policy.id == policy_id))).scalar()
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Policy not found")
+        raise HTTPException(status_code=409, detail="Only failed enrichments can be retried")
+    
+    return await get_policy_enrichment(policy_id, db)
+
+
 @router.post("/policies", response_model=PolicyResponse)
-def create_policy(policy: PolicyCreate, db: Session = Depends(get_db)) -> PolicyResponse:
-    """Create new policy with AI-generated summary, pros, and cons"""
+async def create_policy(
+    policy: PolicyCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
+) -> PolicyResponse:
+    """Create new policy; its AI summary, pros and cons are generated in the background"""
+    
+    async def existing_policy() -> Optional[PolicyResponse]:
+        if not idempotency_key:
+            return None
+        row = (await db.execute(_policies_with_stats().filter(Policy.idempotency_key == idempotency_key))).first()
+        if row is None:
+            return None
+        policy, total_votes, support_votes, oppose_votes, _ = row
+        return PolicyResponse(**_policy_with_stats_dict(policy, total_votes, support_votes, oppose_votes))
+    
+    replayed = await existing_policy()
+    if replayed is not None:
+        return replayed
     
     # Get or create admin user
-    admin_user = db.query(User).first()
-    if not admin_user:
-        admin_user = User(
-            device_id="SYSTEM_ADMIN",
-            name="System Admin",
-            fcm_token=None
-        )
-        db.add(admin_user)
-        db.commit()
-        db.refresh(admin_user)
-    
-    # Generate AI summary if not provided
-    ai_summary = policy.ai_summary
-    if not ai_summary:
-        print(f"🤖 Generating AI summary for: {policy.title}")
-        ai_summary = generate_policy_summary(
-            title=policy.title,
-            description=policy.description,
-            category=policy.category
-        )
-    
-    # Generate AI pros & cons analysis
-    print(f"🤖 Analyzing pros & cons for: {policy.title}")
-    analysis = analyze_policy_pros_cons(
-        title=policy.title,
-        description=policy.description,
-        category=policy.category
-    )
+    admin_user_id = await resolve_user_id(db, "SYSTEM_ADMIN", name="System Admin")
     
-    # Create new policy with AI-generated content
+    # Persist right away; the enrichment pool fills in the AI content
     new_policy = Policy(
         title=policy.title,
         description=policy.description,
         category=policy.category,
-        author_id=admin_user.id,
-        ai_summary=ai_summary,
-        pros=analysis["pros"],
-        cons=analysis["cons"],
-        is_active=True
+        author_id=admin_user_id,
+        ai_summary=policy.ai_summary,
+        is_active=True,
+        ai_status=PENDING,
+        idempotency_key=idempotency_key,
+        tally=PolicyVoteTally()
     )
     
     db.add(new_policy)
-    db.commit()
-    db.refresh(new_policy)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A concurrent request with the same key got there first
+        await db.rollback()
+        replayed = await existing_policy()
+        if replayed is None:
+            raise
+        return replayed
+    
+    # Committed together with the policy, delivered by the outbox worker
+    await enqueue_new_policy(db, new_policy.id, new_policy.title, new_policy.category)
     
-    # Send push notification to all users
-    send_new_policy_notification(new_policy.title)
+    await db.commit()
+    await db.refresh(new_policy)
+    invalidate_feed()
+    enrichment_pool.submit(new_policy.id)
     
     # Build PolicyResponse with required fields
-        # Build PolicyResponse with required fields
     return PolicyResponse(
         id=new_policy.id,
         title=new_policy.title,
@@ -179,5 +290,6 @@ def create_policy(policy: PolicyCreate, db: Session = Depends(get_db)) -> Policy
         support_percentage=0,
         oppose_percentage=0,
         total_votes=0,
-        time_left="No deadline"
+        time_left="No deadline",
+        ai_status=new_policy.ai_status
     )
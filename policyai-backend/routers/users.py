@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_async_db
 from models.user import User
 from models.vote import Vote
 from models.policy import Policy
 from pydantic import BaseModel
+from services.identity_service import resolve_user_id
+from services.topic_subscriptions import topic_subscriptions, topics_for
 
 router = APIRouter()
 
@@ -28,25 +31,22 @@ class UpdateProfileRequest(BaseModel):
 # ========== ENDPOINTS ==========
 
 @router.get("/users/me", response_model=UserProfileResponse)
-def get_user_profile(device_id: str = Query(...), db: Session = Depends(get_db)):
+async def get_user_profile(device_id: str = Query(...), db: AsyncSession = Depends(get_async_db)):
     """Get user profile with voting statistics"""
     
-    # Get user by device_id
-    user = db.query(User).filter(User.device_id == device_id).first()
-    
-    if not user:
-        # Create user if not exists
-        user = User(device_id=device_id, name=f"User_{device_id[:8]}")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
+    # Get user by device_id, creating it if it doesn't exist
+    user_id = await resolve_user_id(db, device_id)
+    user = (await db.execute(
+        select(User.id, User.name, User.device_id, User.created_at).where(User.id == user_id)
+    )).one()
+    await db.commit()
     
     # Get vote counts
-    votes = db.query(Vote).filter(Vote.user_id == user.id).all()
+    votes = (await db.execute(select(Vote.stance).where(Vote.user_id == user.id))).scalars().all()
     
-    support_count = sum(1 for v in votes if v.stance == 'support')
-    oppose_count = sum(1 for v in votes if v.stance == 'oppose')
-    neutral_count = sum(1 for v in votes if v.stance == 'neutral')
+    support_count = sum(1 for stance in votes if stance == 'support')
+    oppose_count = sum(1 for stance in votes if stance == 'oppose')
+    neutral_count = sum(1 for stance in votes if stance == 'neutral')
     
     return {
         "user": {
@@ -66,20 +66,22 @@ def get_user_profile(device_id: str = Query(...), db: Session = Depends(get_db))
 
 
 @router.get("/users/me/voting-history")
-def get_voting_history(device_id: str = Query(...), db: Session = Depends(get_db)):
+async def get_voting_history(device_id: str = Query(...), db: AsyncSession = Depends(get_async_db)):
     """Get complete voting history with policy details"""
     
-    user = db.query(User).filter(User.device_id == device_id).first()
+    user_id = await resolve_user_id(db, device_id, create=False)
     
-    if not user:
+    if user_id is None:
         return {"votes": [], "total": 0}
     
     # Join votes with policies
-    votes = db.query(Vote, Policy).join(
-        Policy, Vote.policy_id == Policy.id
-    ).filter(
-        Vote.user_id == user.id
-    ).order_by(Vote.created_at.desc()).all()
+    votes = (await db.execute(
+        select(Vote, Policy).join(
+            Policy, Vote.policy_id == Policy.id
+        ).where(
+            Vote.user_id == user_id
+        ).order_by(Vote.created_at.desc())
+    )).all()
     
     history = []
     for vote, policy in votes:
@@ -96,43 +98,77 @@ def get_voting_history(device_id: str = Query(...), db: Session = Depends(get_db
 
 
 @router.put("/users/me/update")
-def update_user_profile(
+async def update_user_profile(
     device_id: str = Query(...),
     profile: UpdateProfileRequest = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user profile (name only for now)"""
     
-    user = db.query(User).filter(User.device_id == device_id).first()
+    user_id = await resolve_user_id(db, device_id, create=False)
     
-    if not user:
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
     
     if profile and profile.name:
-        user.name = profile.name
-        db.commit()
-        db.refresh(user)
+        await db.execute(update(User).where(User.id == user_id).values(name=profile.name))
+        await db.commit()
+        name = profile.name
+    else:
+        name = (await db.execute(select(User.name).where(User.id == user_id))).scalar()
     
     return {
         "success": True,
         "user": {
-            "id": user.id,
-            "name": user.name,
-            "device_id": user.device_id,
+            "id": user_id,
+            "name": name,
+            "device_id": device_id,
         }
     }
 
 # fcm_token
 @router.put("/users/me/fcm-token")
-def update_fcm_token(device_id: str, fcm_token: str, db: Session = Depends(get_db)):
-    """Save user's FCM token"""
-    user = db.query(User).filter(User.device_id == device_id).first()
+async def update_fcm_token(
+    device_id: str,
+    fcm_token: str,
+    categories: Optional[List[str]] = Query(None, description="Only notify for these policy categories; omit to keep the current choice"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Save user's FCM token and subscribe it to the matching notification topics"""
+    user_id = await resolve_user_id(db, device_id, create=False)
     
-    if not user:
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user.fcm_token = fcm_token
-    db.commit()
+    current = (await db.execute(
+        select(User.fcm_token, User.notification_categories).where(User.id == user_id)
+    )).one()
+    if categories is None:
+        categories = current.notification_categories
+    
+    # A re-registered token starts with a clean delivery record
+    await db.execute(update(User).where(User.id == user_id).values(
+        fcm_token=fcm_token,
+        fcm_failure_count=0,
+        fcm_quarantined_until=None,
+        notification_categories=categories or None,
+    ))
+    
+    # Only the difference is subscribed; recorded with the user row so a
+    # restart before the background flush doesn't lose it
+    topics = topics_for(categories)
+    stale = []
+    if current.fcm_token:
+        stale = topics_for(current.notification_categories)
+        if current.fcm_token == fcm_token:
+            stale = [topic for topic in stale if topic not in topics]
+        await topic_subscriptions.record(db, current.fcm_token, stale, subscribe=False)
+    await topic_subscriptions.record(db, fcm_token, topics, subscribe=True)
+    await db.commit()
+    
+    if current.fcm_token:
+        topic_subscriptions.unsubscribe(current.fcm_token, stale)
+    topic_subscriptions.subscribe(fcm_token, topics)
     
     return {"message": "FCM token updated"}
 
@@ -1,65 +1,185 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database import get_db
-from models.user import User
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Integer, String, column, delete, literal, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import Tuple
+from database import get_async_db
 from models.vote import Vote
 from models.policy import Policy
-from schemas.vote import VoteCreate, VoteResponse, VoteResults
+from models.policy_vote_tally import PolicyVoteTally
+from schemas.vote import VoteCreate, VoteResponse, VoteResults, VoteBatchCreate, VoteBatchItemResult, VoteBatchResponse
+from services.tally_service import stance_delta, apply_tally_deltas, tally_upsert_from
+from services.response_cache import response_cache, invalidate_policy
+from services.etag import make_etag, etag_matches, not_modified
+from services.identity_service import resolve_user_id
+from services.rate_limiter import rate_limiter
 
 router = APIRouter()
 
 
 @router.post("/{policy_id}/vote", response_model=VoteResponse)
-def cast_vote(policy_id: int, vote_data: VoteCreate, db: Session = Depends(get_db)):
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
+async def cast_vote(policy_id: int, vote_data: VoteCreate, db: AsyncSession = Depends(get_async_db)):
+    """Cast or change a vote"""
+    
+    await rate_limiter.enforce("vote", vote_data.device_id)
+    
+    user_id = await resolve_user_id(db, vote_data.device_id)
+    vote_columns = (Vote.id, Vote.user_id, Vote.policy_id, Vote.stance, Vote.created_at)
+    
+    inserted = pg_insert(Vote).from_select(
+        ["user_id", "policy_id", "stance"],
+        select(literal(user_id), Policy.id, literal(vote_data.stance)).where(Policy.id == policy_id),
+    ).on_conflict_do_nothing(
+        constraint="uq_user_policy_vote"
+    ).returning(*vote_columns).cte("inserted")
+    
+    vote = (await db.execute(
+        select(inserted).add_cte(tally_upsert_from(inserted).cte("tally"))
+    )).first()
+    
+    if vote is None:
+        previous = select(Vote.id, Vote.stance).where(
+            Vote.user_id == user_id, Vote.policy_id == policy_id
+        ).with_for_update().subquery("previous")
+        
+        updated = update(Vote).where(
+            Vote.id == previous.c.id
+        ).values(
+            stance=vote_data.stance
+        ).returning(*vote_columns, previous.c.stance.label("previous_stance")).cte("updated")
+        
+        vote = (await db.execute(
+            select(updated).add_cte(tally_upsert_from(updated, "previous_stance").cte("tally"))
+        )).first()
+    
+    if vote is None:
+        # No vote was inserted or updated, so the policy doesn't exist
+        await db.rollback()
         raise HTTPException(status_code=404, detail="Policy not found")
     
-    user = db.query(User).filter(User.device_id == vote_data.device_id).first()
-    if not user:
-        user = User(device_id=vote_data.device_id, name="Anonymous")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    
-    existing_vote = db.query(Vote).filter(
-        Vote.user_id == user.id, Vote.policy_id == policy_id
-    ).first()
-    
-    if existing_vote:
-        existing_vote.stance = vote_data.stance
-        db.commit()
-        db.refresh(existing_vote)
-        return existing_vote
-    
-    new_vote = Vote(user_id=user.id, policy_id=policy_id, stance=vote_data.stance)
-    db.add(new_vote)
-    db.commit()
-    db.refresh(new_vote)
-    return new_vote
+    await db.commit()
+    invalidate_policy(policy_id)
+    
+    return VoteResponse(
+        id=vote.id,
+        user_id=vote.user_id,
+        policy_id=vote.policy_id,
+        stance=vote.stance,
+        created_at=vote.created_at
+    )
+
+
+@router.post("/votes/batch", response_model=VoteBatchResponse)
+async def cast_votes_batch(batch: VoteBatchCreate, db: AsyncSession = Depends(get_async_db)):
+    """Apply many votes for one device in a single transaction.
+    
+    Meant for votes queued while offline or quick swiping: new votes go in with
+    one INSERT ... ON CONFLICT DO NOTHING, changed ones with one UPDATE that
+    also returns the previous stance, and tallies with one upsert.
+    """
+    
+    # Each vote costs a token, the same as voting one at a time
+    await rate_limiter.enforce("vote", batch.device_id, cost=len(batch.votes))
+    
+    user_id = await resolve_user_id(db, batch.device_id)
+    
+    # Last item wins when a batch votes on the same policy more than once
+    stances = {}
+    for item in batch.votes:
+        stances[item.policy_id] = item.stance
+    
+    data = values(
+        column("policy_id", Integer), column("stance", String), name="batch"
+    ).data(list(stances.items()))
+    
+    # New votes; joining policies drops items for policies that don't exist
+    inserted = (await db.execute(
+        pg_insert(Vote).from_select(
+            ["user_id", "policy_id", "stance"],
+            select(literal(user_id), Policy.id, data.c.stance).join_from(data, Policy, Policy.id == data.c.policy_id),
+        ).on_conflict_do_nothing(
+            constraint="uq_user_policy_vote"
+        ).returning(Vote.id, Vote.policy_id, Vote.stance)
+    )).all()
+    
+    outcomes = {row.policy_id: ("created", row.id, None) for row in inserted}
+    
+    # Existing votes; the locked subquery yields the stance being replaced
+    remaining = [policy_id for policy_id in stances if policy_id not in outcomes]
+    if remaining:
+        previous = select(Vote.id, Vote.policy_id, Vote.stance).where(
+            Vote.user_id == user_id, Vote.policy_id.in_(remaining)
+        ).with_for_update().subquery("previous")
+        
+        updated = (await db.execute(
+            update(Vote).where(
+                Vote.id == previous.c.id, previous.c.policy_id == data.c.policy_id
+            ).values(
+                stance=data.c.stance
+            ).returning(Vote.id, Vote.policy_id, previous.c.stance.label("previous_stance"))
+        )).all()
+        
+        for row in updated:
+            status = "unchanged" if row.previous_stance == stances[row.policy_id] else "updated"
+            outcomes[row.policy_id] = (status, row.id, row.previous_stance)
+    
+    deltas = {}
+    for policy_id, (status, _, previous_stance) in outcomes.items():
+        deltas[policy_id] = stance_delta(previous_stance, stances[policy_id])
+    await apply_tally_deltas(db, deltas)
+    
+    await db.commit()
+    for policy_id, (status, _, _) in outcomes.items():
+        if status != "unchanged":
+            invalidate_policy(policy_id)
+    
+    results = []
+    for index, item in enumerate(batch.votes):
+        if any(later.policy_id == item.policy_id for later in batch.votes[index + 1:]):
+            results.append(VoteBatchItemResult(policy_id=item.policy_id, stance=item.stance, status="superseded"))
+            continue
+        
+        status, vote_id, _ = outcomes.get(item.policy_id, ("not_found", None, None))
+        results.append(VoteBatchItemResult(policy_id=item.policy_id, stance=item.stance, status=status, vote_id=vote_id))
+    
+    return VoteBatchResponse(
+        results=results,
+        applied=sum(1 for status, _, _ in outcomes.values() if status != "unchanged")
+    )
 
 
 @router.get("/{policy_id}/results", response_model=VoteResults)
-def get_results(policy_id: int, db: Session = Depends(get_db)):
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
-        raise HTTPException(status_code=404, detail="Policy not found")
+async def get_results(policy_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    # The ETag is cached with the results, so a hit answers If-None-Match without the database
+    etag, results = await response_cache.get_or_load(("results", policy_id), lambda: _load_results(db, policy_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    vote_counts = db.query(Vote.stance, func.count(Vote.id).label('count')
-    ).filter(Vote.policy_id == policy_id).group_by(Vote.stance).all()
+    response.headers["ETag"] = etag
+    return results
+
+
+async def _load_results(db: AsyncSession, policy_id: int) -> Tuple[str, VoteResults]:
+    """(ETag, results) for a policy"""
+    row = (await db.execute(
+        select(Policy.id, PolicyVoteTally).outerjoin(
+            PolicyVoteTally, PolicyVoteTally.policy_id == Policy.id
+        ).where(Policy.id == policy_id)
+    )).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Policy not found")
     
-    counts = {stance: count for stance, count in vote_counts}
-    support = counts.get('support', 0)
-    oppose = counts.get('oppose', 0)
-    neutral = counts.get('neutral', 0)
-    total = support + oppose + neutral
+    tally = row[1]
+    support = tally.support_count if tally else 0
+    oppose = tally.oppose_count if tally else 0
+    neutral = tally.neutral_count if tally else 0
+    total = tally.total_votes if tally else 0
     
     support_pct = round((support / total) * 100) if total > 0 else 0
     oppose_pct = round((oppose / total) * 100) if total > 0 else 0
     neutral_pct = round((neutral / total) * 100) if total > 0 else 0
     
-    return VoteResults(
+    return make_etag("results", policy_id, tally.version if tally else None), VoteResults(
         policy_id=policy_id, total_votes=total,
         support_count=support, oppose_count=oppose, neutral_count=neutral,
         support_percentage=support_pct, oppose_percentage=oppose_pct, 
@@ -67,26 +187,31 @@ def get_results(policy_id: int, db: Session = Depends(get_db)):
     )
 
 @router.delete("/{policy_id}/vote")
-def delete_vote(policy_id: int, device_id: str = Query(...), db: Session = Depends(get_db)):
+async def delete_vote(policy_id: int, device_id: str = Query(...), db: AsyncSession = Depends(get_async_db)):
     """Withdraw vote"""
     
-    policy = db.query(Policy).filter(Policy.id == policy_id).first()
-    if not policy:
+    policy_exists = (await db.execute(select(Policy.id).where(Policy.id == policy_id))).scalar()
+    if policy_exists is None:
         raise HTTPException(status_code=404, detail="Policy not found")
     
-    user = db.query(User).filter(User.device_id == device_id).first()
-    if not user:
+    user_id = await resolve_user_id(db, device_id, create=False)
+    if user_id is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    existing_vote = db.query(Vote).filter(
-        Vote.user_id == user.id,
+    deleted = delete(Vote).where(
+        Vote.user_id == user_id,
         Vote.policy_id == policy_id
-    ).first()
+    ).returning(Vote.policy_id, Vote.stance).cte("deleted")
+    
+    vote = (await db.execute(
+        select(deleted).add_cte(tally_upsert_from(deleted, removed=True).cte("tally"))
+    )).first()
     
-    if not existing_vote:
+    if vote is None:
+        await db.rollback()
         raise HTTPException(status_code=404, detail="No vote found")
     
-    db.delete(existing_vote)
-    db.commit()
+    await db.commit()
+    invalidate_policy(policy_id)
     
     return {"message": "Vote withdrawn successfully"}
\ No newline at end of file
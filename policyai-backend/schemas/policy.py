@@ -39,12 +39,21 @@ class PolicyResponse(BaseModel):
 
     pros: Optional[List[str]] = None
     cons: Optional[List[str]] = None
+    ai_status: Optional[str] = None
     
     
     model_config = {
         "from_attributes": True  # Replaces orm_mode in Pydantic v2
     }
 
+class PolicyEnrichmentStatus(BaseModel):
+    """Progress of the background AI summary / pros / cons generation"""
+    policy_id: int
+    status: str  # "pending", "processing", "done" or "failed"
+    attempts: int
+    error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None  # Set while a pending policy is deferred
+
 class VoteCreate(BaseModel):
     policy_id: int
     stance: str  # "support" or "oppose"
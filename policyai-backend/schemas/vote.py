@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Literal
+from typing import List, Literal, Optional
+from config import settings
 
 
 class VoteCreate(BaseModel):
@@ -28,3 +29,28 @@ class VoteResults(BaseModel):
     support_percentage: int
     oppose_percentage: int
     neutral_percentage: int
+
+
+class VoteBatchItem(BaseModel):
+    policy_id: int
+    stance: Literal['support', 'oppose', 'neutral']
+
+
+class VoteBatchCreate(BaseModel):
+    device_id: str = Field(..., min_length=10)
+    # No larger than the vote bucket, so every batch the schema accepts can be paid for
+    votes: List[VoteBatchItem] = Field(..., min_length=1, max_length=settings.RATE_LIMIT_VOTE_BURST)
+
+
+class VoteBatchItemResult(BaseModel):
+    policy_id: int
+    stance: str
+    # created / updated / unchanged, not_found for unknown policies and
+    # superseded when a later item in the same batch targets the same policy
+    status: Literal['created', 'updated', 'unchanged', 'not_found', 'superseded']
+    vote_id: Optional[int] = None
+
+
+class VoteBatchResponse(BaseModel):
+    results: List[VoteBatchItemResult]
+    applied: int
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from database import engine, SessionLocal
 from models.user import User
 from models.policy import Policy
+from models.policy_vote_tally import PolicyVoteTally
 from datetime import datetime, timedelta
 
 def seed_database():
@@ -132,7 +133,7 @@ def seed_database():
         
         # ✅ STEP 4: Add all policies
         for policy_data in sample_policies:
-            policy = Policy(**policy_data)
+            policy = Policy(**policy_data, tally=PolicyVoteTally())
             db.add(policy)
         
         db.commit()
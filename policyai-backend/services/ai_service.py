@@ -1,179 +1,191 @@
-import os
-from google import genai
-from google.genai import types
-
-# Initialize client
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("⚠️ GEMINI_API_KEY not found in environment")
-        AI_AVAILABLE = False
-    else:
-        client = genai.Client(api_key=api_key)
-        AI_AVAILABLE = True
-        print("✅ Gemini AI initialized successfully")
-except Exception as e:
-    AI_AVAILABLE = False
-    print(f"⚠️ Gemini AI initialization failed: {e}")
-
-
-def generate_policy_summary(title: str, description: str, category: str) -> str:
-    """Generate AI-powered summary for policy using Gemini Flash"""
-    
-    if not AI_AVAILABLE:
-        # Fallback: Simple truncation
-        return description[:100] + "..." if len(description) > 100 else description
-    
-    try:
-        # Create prompt for policy summary
-        prompt = f"""You are a policy analyst. Generate a concise, neutral summary (40-50 words) of this policy proposal.
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+from pydantic import BaseModel, Field
+from config import settings
+from services.analysis_cache import analysis_cache, analysis_key
+from services.circuit_breaker import CircuitBreaker
+from services.llm_provider import get_provider
+
+# Initialize provider (Gemini, or the offline stub; see LLM_PROVIDER)
+provider = get_provider()
+AI_AVAILABLE = provider is not None
+
+# Every model call, async or from a thread, passes the breaker and the
+# concurrency cap; a slow or failing model then costs a fast fallback instead
+# of piling up requests behind it.
+breaker = CircuitBreaker(
+    "llm",
+    failure_threshold=settings.AI_BREAKER_FAILURE_THRESHOLD,
+    slow_call_seconds=settings.AI_BREAKER_SLOW_CALL_SECONDS,
+    reset_seconds=settings.AI_BREAKER_RESET_SECONDS,
+)
+_call_slots = asyncio.Semaphore(settings.AI_MAX_CONCURRENT_CALLS)
+_thread_call_slots = threading.BoundedSemaphore(settings.AI_MAX_CONCURRENT_CALLS)
+# Shared by the event loop and worker threads
+_calls_in_flight = 0
+_calls_in_flight_lock = threading.Lock()
+
+# Bump whenever _analysis_prompt or PolicyAnalysis changes; cached analyses
+# from other versions stop matching
+PROMPT_VERSION = 1
+
+FALLBACK_PROS = ["Addresses an important issue", "Could benefit citizens", "Shows policy initiative"]
+FALLBACK_CONS = ["Implementation details unclear", "Funding sources not specified", "Timeline not defined"]
+
+
+class PolicyAnalysis(BaseModel):
+    """Structured reply of the combined summary + pros/cons prompt"""
+    summary: str = Field(..., min_length=1)
+    pros: List[str] = Field(..., min_length=3)
+    cons: List[str] = Field(..., min_length=3)
+
+
+def _fallback_summary(description: str) -> str:
+    """Simple truncation when the model can't be used"""
+    return description[:100] + "..." if len(description) > 100 else description
+
+
+def fallback_analysis(description: str) -> dict:
+    return {"summary": _fallback_summary(description), "pros": list(FALLBACK_PROS), "cons": list(FALLBACK_CONS)}
+
+
+def _analysis_prompt(title: str, description: str, category: str) -> str:
+    return f"""You are a policy analyst. Analyze this policy proposal.
 
 Policy Title: {title}
 Category: {category}
 Full Description: {description}
 
-Summary (40-50 words, neutral tone):"""
-
-        # Call Gemini 2.5 Flash (fastest, cheapest model)
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt
-        )
-        
-        summary = response.text.strip()
-        print(f"✅ AI Summary generated: {summary[:50]}...")
-        return summary
-        
-    except Exception as e:
-        print(f"❌ AI Summary generation failed: {e}")
-        # Fallback to simple truncation
-        return description[:100] + "..." if len(description) > 100 else description
+Reply with a JSON object with exactly these fields:
+- "summary": a concise, neutral summary of the policy (40-50 words)
+- "pros": exactly 3 benefits/advantages, each one clear sentence of 10-15 words
+- "cons": exactly 3 concerns/drawbacks, each one clear sentence of 10-15 words
+
+Be balanced and objective."""
 
 
-def analyze_policy_pros_cons(title: str, description: str) -> dict:
-    """Analyze policy and generate pros/cons (Future feature)"""
+def parse_policy_analysis(text: str) -> dict:
+    """Strictly parse the model's JSON reply.
     
-    if not AI_AVAILABLE:
-        return {"pros": [], "cons": [], "error": "AI not available"}
+    Raises ValueError unless the reply is a JSON object with a non-empty
+    summary and at least 3 non-empty pros and cons (extra points are dropped).
+    """
+    analysis = PolicyAnalysis.model_validate(json.loads(text))
+    
+    summary = analysis.summary.strip()
+    pros = [point.strip() for point in analysis.pros if point.strip()][:3]
+    cons = [point.strip() for point in analysis.cons if point.strip()][:3]
+    if not summary or len(pros) < 3 or len(cons) < 3:
+        raise ValueError("Analysis is missing a summary or has fewer than 3 pros/cons")
+    
+    return {"summary": summary, "pros": pros, "cons": cons}
+
+
+@contextmanager
+def _counted_call():
+    global _calls_in_flight
+    with _calls_in_flight_lock:
+        _calls_in_flight += 1
+    try:
+        yield
+    finally:
+        with _calls_in_flight_lock:
+            _calls_in_flight -= 1
+
+
+async def _call_model(prompt: str) -> str:
+    """One async provider call under the breaker, concurrency cap and deadline"""
+    breaker.check()
+    
+    try:
+        async with _call_slots:
+            started = time.monotonic()
+            with _counted_call():
+                reply = await asyncio.wait_for(
+                    provider.agenerate_json(prompt, PolicyAnalysis),
+                    timeout=settings.AI_CALL_TIMEOUT_SECONDS,
+                )
+    except asyncio.TimeoutError:
+        breaker.record_failure(timeout=True)
+        raise
+    except asyncio.CancelledError:
+        breaker.record_abandoned()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    
+    breaker.record_success(time.monotonic() - started)
+    return reply
+
+
+def _call_model_sync(prompt: str) -> str:
+    """_call_model for scripts and worker threads; the provider enforces the deadline"""
+    breaker.check()
     
     try:
-        prompt = f"""Analyze this policy proposal and provide:
-1. Three main PROS (benefits/advantages)
-2. Three main CONS (drawbacks/concerns)
-
-Policy: {title}
-Description: {description}
-
-Format response as:
-PROS:
-1. [Pro 1]
-2. [Pro 2]
-3. [Pro 3]
-
-CONS:
-1. [Con 1]
-2. [Con 2]
-3. [Con 3]"""
-
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt
-        )
-        
-        # Parse response (you'll implement parsing logic)
-        analysis_text = response.text.strip()
-        
-        return {
-            "raw_analysis": analysis_text,
-            "success": True
-        }
-        
+        with _thread_call_slots:
+            started = time.monotonic()
+            with _counted_call():
+                reply = provider.generate_json(prompt, PolicyAnalysis)
     except Exception as e:
-        print(f"❌ Policy analysis failed: {e}")
-        return {"error": str(e), "success": False}
+        breaker.record_failure(timeout="timeout" in type(e).__name__.lower())
+        raise
+    
+    breaker.record_success(time.monotonic() - started)
+    return reply
+
 
-def analyze_policy_pros_cons(title: str, description: str, category: str) -> dict:
-    """Generate AI-powered pros and cons analysis for policy"""
+async def arequest_policy_analysis(title: str, description: str, category: str) -> dict:
+    """Summary, pros and cons from a single structured call to the provider.
     
+    Answers are cached by content (see services/analysis_cache.py). Raises on
+    API errors, timeouts and replies that fail parse_policy_analysis, so
+    callers can retry; an open breaker raises CircuitOpenError, whose
+    retry_after says when a retry can get through. Without a provider the
+    fallback content is returned.
+    """
     if not AI_AVAILABLE:
-        # Fallback: Generic response
-        return {
-            "pros": ["Addresses an important issue", "Could benefit citizens", "Shows policy initiative"],
-            "cons": ["Implementation details unclear", "Funding sources not specified", "Timeline not defined"]
-        }
+        return fallback_analysis(description)
     
-    try:
-        # Create prompt for pros/cons analysis
-        prompt = f"""You are a policy analyst. Analyze this policy and provide exactly 3 PROS (benefits/advantages) and 3 CONS (concerns/drawbacks).
+    key = analysis_key(title, description, category, PROMPT_VERSION, provider.model)
+    cached = await analysis_cache.aget(key)
+    if cached is not None:
+        return cached
+    
+    analysis = parse_policy_analysis(await _call_model(_analysis_prompt(title, description, category)))
+    print(f"✅ AI Analysis generated for: {title[:50]}...")
+    await analysis_cache.aput(key, analysis, PROMPT_VERSION, provider.model)
+    return analysis
 
-Policy Title: {title}
-Category: {category}
-Description: {description}
-
-Format your response EXACTLY like this:
-PROS:
-1. [First benefit in one clear sentence]
-2. [Second benefit in one clear sentence]
-3. [Third benefit in one clear sentence]
-
-CONS:
-1. [First concern in one clear sentence]
-2. [Second concern in one clear sentence]
-3. [Third concern in one clear sentence]
-
-Keep each point concise (10-15 words). Be balanced and objective."""
-
-        # Call Gemini API
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=prompt
-        )
-        
-        analysis_text = response.text.strip()
-        print(f"✅ AI Analysis generated for: {title[:50]}...")
-        
-        # Parse the response
-        pros = []
-        cons = []
-        
-        lines = analysis_text.split('\n')
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            
-            if 'PROS:' in line.upper():
-                current_section = 'pros'
-                continue
-            elif 'CONS:' in line.upper():
-                current_section = 'cons'
-                continue
-            
-            # Extract numbered points
-            if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
-                # Remove numbering and clean up
-                cleaned = line.lstrip('0123456789.-•) ').strip()
-                
-                if cleaned and current_section == 'pros':
-                    pros.append(cleaned)
-                elif cleaned and current_section == 'cons':
-                    cons.append(cleaned)
-        
-        # Ensure we have exactly 3 of each
-        pros = pros[:3] if len(pros) >= 3 else pros + ["Additional benefit needs analysis"] * (3 - len(pros))
-        cons = cons[:3] if len(cons) >= 3 else cons + ["Additional concern needs analysis"] * (3 - len(cons))
-        
-        print(f"✅ Parsed {len(pros)} pros and {len(cons)} cons")
-        
-        return {
-            "pros": pros,
-            "cons": cons
-        }
-        
-    except Exception as e:
-        print(f"❌ AI Pros/Cons analysis failed: {e}")
-        # Fallback
-        return {
-            "pros": ["Addresses an important issue", "Could benefit citizens", "Shows policy initiative"],
-            "cons": ["Implementation details need clarity", "Funding sources require specification", "Timeline needs definition"]
-        }
+
+def request_policy_analysis(title: str, description: str, category: str) -> dict:
+    """Blocking arequest_policy_analysis, for scripts and worker threads"""
+    if not AI_AVAILABLE:
+        return fallback_analysis(description)
+    
+    key = analysis_key(title, description, category, PROMPT_VERSION, provider.model)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    analysis = parse_policy_analysis(_call_model_sync(_analysis_prompt(title, description, category)))
+    print(f"✅ AI Analysis generated for: {title[:50]}...")
+    analysis_cache.put(key, analysis, PROMPT_VERSION, provider.model)
+    return analysis
+
+
+def ai_stats() -> dict:
+    """Provider, concurrency and circuit breaker state for monitoring"""
+    return {
+        "provider": provider.name if provider else None,
+        "model": provider.model if provider else None,
+        "call_timeout_seconds": settings.AI_CALL_TIMEOUT_SECONDS,
+        "max_concurrent_calls": settings.AI_MAX_CONCURRENT_CALLS,
+        "calls_in_flight": _calls_in_flight,
+        "breaker": breaker.stats(),
+    }
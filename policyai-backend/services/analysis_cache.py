@@ -0,0 +1,176 @@
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import settings
+from database import AsyncSessionLocal, SessionLocal
+from models.ai_analysis_cache import AIAnalysisCache
+
+
+def _normalize(text: str) -> str:
+    """Case, Unicode form and whitespace differences shouldn't miss the cache"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip().casefold()
+
+
+def analysis_key(title: str, description: str, category: str, prompt_version: int, model: str) -> str:
+    """Content address of an analysis: sha256 over normalized inputs, prompt version and model"""
+    payload = json.dumps(
+        [_normalize(title), _normalize(description), _normalize(category), prompt_version, model],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Two-level cache of model analyses: an in-process LRU in front of the
+    ai_analysis_cache table, which every process and restart shares.
+    
+    Only real model output is stored, never fallback content. Database errors
+    are reported and treated as misses so caching can't break generation.
+    aget / aput serve the event loop over the async engine; get / put are for
+    scripts and worker threads, hence the lock.
+    """
+    
+    def __init__(self, max_entries: int = 1024, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.errors = 0
+    
+    def _remember(self, key: str, analysis: dict) -> None:
+        with self._lock:
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _memory_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return analysis
+    
+    def _loaded(self, key: str, row) -> Optional[dict]:
+        """Count a database lookup and remember what it found"""
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.db_hits += 1
+        analysis = {"summary": row.summary, "pros": list(row.pros), "cons": list(row.cons)}
+        self._remember(key, analysis)
+        return analysis
+    
+    @staticmethod
+    def _lookup(key: str):
+        return select(AIAnalysisCache.summary, AIAnalysisCache.pros, AIAnalysisCache.cons).where(AIAnalysisCache.key == key)
+    
+    @staticmethod
+    def _insert(key: str, analysis: dict, prompt_version: int, model: str):
+        return pg_insert(AIAnalysisCache).values(
+            key=key,
+            prompt_version=prompt_version,
+            model=model,
+            summary=analysis["summary"],
+            pros=analysis["pros"],
+            cons=analysis["cons"],
+        ).on_conflict_do_nothing(index_elements=[AIAnalysisCache.key])
+    
+    async def aget(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        
+        analysis = self._memory_get(key)
+        if analysis is not None:
+            return analysis
+        
+        try:
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(self._lookup(key))).first()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ AI cache lookup failed: {e}")
+            row = None
+        return self._loaded(key, row)
+    
+    async def aput(self, key: str, analysis: dict, prompt_version: int, model: str) -> None:
+        if not self.enabled:
+            return
+        
+        self._remember(key, analysis)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(self._insert(key, analysis, prompt_version, model))
+                await db.commit()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ AI cache write failed: {e}")
+    
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        
+        analysis = self._memory_get(key)
+        if analysis is not None:
+            return analysis
+        
+        try:
+            with SessionLocal() as db:
+                row = db.execute(self._lookup(key)).first()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ AI cache lookup failed: {e}")
+            row = None
+        return self._loaded(key, row)
+    
+    def put(self, key: str, analysis: dict, prompt_version: int, model: str) -> None:
+        if not self.enabled:
+            return
+        
+        self._remember(key, analysis)
+        try:
+            with SessionLocal() as db:
+                db.execute(self._insert(key, analysis, prompt_version, model))
+                db.commit()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ AI cache write failed: {e}")
+    
+    def prune(self, prompt_version: int) -> int:
+        """Delete rows written by other prompt versions; they can never hit again"""
+        with SessionLocal() as db:
+            result = db.execute(delete(AIAnalysisCache).where(AIAnalysisCache.prompt_version != prompt_version))
+            db.commit()
+            return result.rowcount
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+analysis_cache = AnalysisCache(
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    enabled=settings.AI_CACHE_ENABLED,
+)
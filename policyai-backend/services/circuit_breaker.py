@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its breaker is open;
+    retry_after is how many seconds until it lets a probe through"""
+    
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency and probes it before trusting it again.
+    
+    Closed: calls go through; failure_threshold consecutive failures (errors,
+    timeouts, or calls slower than slow_call_seconds) open the breaker.
+    Open: calls are rejected for reset_seconds, then the breaker turns
+    half-open. Half-open: up to half_open_probes calls go through; a success
+    closes the breaker, a failure opens it again.
+    
+    Thread safe, so the event loop and worker threads can share one breaker.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_seconds: Optional[float] = None,
+        reset_seconds: float = 30.0,
+        half_open_probes: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.times_opened = 0
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+    
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+    
+    def _open(self) -> None:
+        if self._state != OPEN:
+            self.times_opened += 1
+            print(f"🔌 Circuit '{self.name}' opened after {self._consecutive_failures} failures")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead; every allowed call must be followed by
+        record_success, record_failure or record_abandoned."""
+        with self._lock:
+            self._maybe_half_open()
+            
+            if self._state == OPEN:
+                self.rejected += 1
+                return False
+            
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self.rejected += 1
+                    return False
+                self._probes_in_flight += 1
+            
+            self.calls += 1
+            return True
+    
+    def check(self) -> None:
+        """allow(), raising CircuitOpenError when the call must not be made"""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open", retry_after=self.retry_after())
+    
+    def retry_after(self) -> float:
+        """Seconds until an open breaker turns half-open (0 otherwise)"""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+    
+    def record_success(self, seconds: float) -> None:
+        if self.slow_call_seconds is not None and seconds > self.slow_call_seconds:
+            with self._lock:
+                self.slow_calls += 1
+            self.record_failure()
+            return
+        
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._probes_in_flight = 0
+                print(f"🔌 Circuit '{self.name}' closed")
+    
+    def record_failure(self, timeout: bool = False) -> None:
+        with self._lock:
+            self.failures += 1
+            if timeout:
+                self.timeouts += 1
+            self._consecutive_failures += 1
+            
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._open()
+    
+    def record_abandoned(self) -> None:
+        """The caller gave up (e.g. was cancelled) before the call finished"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+    
+    def stats(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "slow_call_seconds": self.slow_call_seconds,
+                "reset_seconds": self.reset_seconds,
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+            }
@@ -0,0 +1,262 @@
+import asyncio
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import and_, func, or_, select, update
+from config import settings
+from database import AsyncSessionLocal
+from models.policy import Policy
+from services.ai_service import arequest_policy_analysis
+from services.circuit_breaker import CircuitOpenError
+from services.response_cache import invalidate_policy
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+
+async def enrich_policy(title: str, description: str, category: str, ai_summary: Optional[str] = None) -> dict:
+    """Generate a policy's AI content with one structured model call.
+    
+    Raises on model errors so the pool can retry; a summary supplied by the
+    author is kept.
+    """
+    analysis = await arequest_policy_analysis(title, description, category)
+    return {"ai_summary": ai_summary or analysis["summary"], "pros": analysis["pros"], "cons": analysis["cons"]}
+
+
+class EnrichmentPool:
+    """Fills in ai_summary / pros / cons for policies in the background.
+    
+    create_policy commits the row with ai_status "pending" and submits its id.
+    A fixed number of worker tasks bounds how many policies are enriched at
+    once; each attempt has a timeout and failures are retried with exponential
+    backoff. A round that runs out of attempts puts the row back to "pending"
+    with ai_next_attempt_at set defer_seconds ahead (doubling per failed
+    round); finding the model's breaker open defers the row until the breaker
+    lets calls through again, without costing an attempt. Only after
+    max_rounds failed rounds is the row marked "failed"; requeue_failed gives
+    such rows a fresh start.
+    
+    Rows are claimed with a conditional UPDATE, so several processes can run a
+    pool against one database without enriching a policy twice. A periodic
+    sweep picks up pending rows whose submit was lost (e.g. a restart) and
+    "processing" rows whose worker died.
+    """
+    
+    def __init__(
+        self,
+        workers: int = 4,
+        timeout_seconds: float = 30.0,
+        max_attempts: int = 3,
+        retry_backoff_seconds: float = 2.0,
+        sweep_seconds: float = 60.0,
+        defer_seconds: float = 300.0,
+        max_rounds: int = 5,
+    ):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.sweep_seconds = sweep_seconds
+        self.defer_seconds = defer_seconds
+        self.max_rounds = max_rounds
+        
+        # A claim older than the longest possible run belongs to a dead worker
+        self.stale_after = timedelta(seconds=(
+            timeout_seconds * max_attempts + retry_backoff_seconds * (2 ** max_attempts) + 60
+        ))
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued = set()
+        self._tasks = []
+        
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.deferred = 0
+        self.retries = 0
+        self.timeouts = 0
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+    
+    def start(self) -> None:
+        """Start the workers and sweeper on the running loop"""
+        if self.running:
+            return
+        
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        print(f"🤖 AI enrichment pool started ({self.workers} workers)")
+    
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queued.clear()
+    
+    def submit(self, policy_id: int) -> None:
+        """Queue a committed pending policy; a no-op if it's already queued"""
+        if self._queue is None or policy_id in self._queued:
+            return
+        self._queued.add(policy_id)
+        self._queue.put_nowait(policy_id)
+    
+    def _claimable(self):
+        return or_(
+            and_(
+                Policy.ai_status == PENDING,
+                or_(Policy.ai_next_attempt_at.is_(None), Policy.ai_next_attempt_at <= func.now()),
+            ),
+            and_(Policy.ai_status == PROCESSING, Policy.updated_at < func.now() - self.stale_after),
+        )
+    
+    async def _sweep(self) -> None:
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    policy_ids = (await db.execute(
+                        select(Policy.id).where(self._claimable()).order_by(Policy.id).limit(1000)
+                    )).scalars().all()
+                for policy_id in policy_ids:
+                    self.submit(policy_id)
+            except Exception as e:
+                print(f"❌ AI enrichment sweep failed: {e}")
+            
+            await asyncio.sleep(self.sweep_seconds)
+    
+    async def _work(self) -> None:
+        while True:
+            policy_id = await self._queue.get()
+            self._queued.discard(policy_id)
+            self.in_flight += 1
+            try:
+                await self._process(policy_id)
+            except Exception as e:
+                print(f"❌ AI enrichment of policy {policy_id} crashed: {e}")
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+    
+    async def _process(self, policy_id: int) -> None:
+        async with AsyncSessionLocal() as db:
+            policy = (await db.execute(
+                update(Policy).where(
+                    Policy.id == policy_id, self._claimable()
+                ).values(
+                    ai_status=PROCESSING
+                ).returning(Policy.title, Policy.description, Policy.category, Policy.ai_summary, Policy.ai_attempts)
+            )).first()
+            await db.commit()
+        
+        if policy is None:
+            return  # Already done, or claimed by another worker
+        
+        error = None
+        attempts = 0
+        while attempts < self.max_attempts:
+            try:
+                result = await asyncio.wait_for(
+                    enrich_policy(policy.title, policy.description, policy.category, policy.ai_summary),
+                    timeout=self.timeout_seconds,
+                )
+            except CircuitOpenError as e:
+                # The model is known to be down; come back when the breaker probes again
+                await self._defer(policy_id, attempts, str(e), e.retry_after)
+                return
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                error = f"Timed out after {self.timeout_seconds:g}s"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            else:
+                await self._finish(policy_id, attempts + 1, ai_status=DONE, ai_error=None, ai_next_attempt_at=None, **result)
+                self.completed += 1
+                return
+            
+            attempts += 1
+            if attempts < self.max_attempts:
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff_seconds * (2 ** (attempts - 1)))
+        
+        rounds = (policy.ai_attempts + attempts) // self.max_attempts
+        if rounds < self.max_rounds:
+            await self._defer(policy_id, attempts, error, self.defer_seconds * (2 ** (rounds - 1)))
+            return
+        
+        print(f"❌ AI enrichment of policy {policy_id} failed: {error}")
+        await self._finish(policy_id, attempts, ai_status=FAILED, ai_error=error, ai_next_attempt_at=None)
+        self.failed += 1
+    
+    async def _defer(self, policy_id: int, attempts: int, error: str, delay_seconds: float) -> None:
+        """Hand the row back as pending; the sweep resubmits it once delay_seconds pass"""
+        print(f"⏳ AI enrichment of policy {policy_id} deferred {delay_seconds:g}s: {error}")
+        await self._finish(
+            policy_id, attempts,
+            ai_status=PENDING,
+            ai_error=error,
+            ai_next_attempt_at=func.now() + timedelta(seconds=delay_seconds),
+        )
+        self.deferred += 1
+    
+    async def _finish(self, policy_id: int, attempts: int, **values) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Policy).where(
+                    Policy.id == policy_id, Policy.ai_status == PROCESSING
+                ).values(
+                    ai_attempts=Policy.ai_attempts + attempts, **values
+                )
+            )
+            await db.commit()
+        invalidate_policy(policy_id)
+    
+    async def requeue_failed(self, policy_id: Optional[int] = None) -> int:
+        """Give failed rows (all, or just policy_id) a fresh set of rounds.
+        
+        Returns how many rows were requeued; the sweep picks them up if this
+        process isn't running the pool.
+        """
+        condition = Policy.ai_status == FAILED
+        if policy_id is not None:
+            condition = and_(condition, Policy.id == policy_id)
+        
+        async with AsyncSessionLocal() as db:
+            policy_ids = (await db.execute(
+                update(Policy).where(condition).values(
+                    ai_status=PENDING, ai_attempts=0, ai_error=None, ai_next_attempt_at=None
+                ).returning(Policy.id).execution_options(synchronize_session=False)
+            )).scalars().all()
+            await db.commit()
+        
+        for requeued_id in policy_ids:
+            self.submit(requeued_id)
+        return len(policy_ids)
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+        }
+
+
+enrichment_pool = EnrichmentPool(
+    workers=settings.AI_ENRICHMENT_WORKERS,
+    timeout_seconds=settings.AI_ENRICHMENT_TIMEOUT_SECONDS,
+    max_attempts=settings.AI_ENRICHMENT_MAX_ATTEMPTS,
+    retry_backoff_seconds=settings.AI_ENRICHMENT_RETRY_BACKOFF_SECONDS,
+    sweep_seconds=settings.AI_ENRICHMENT_SWEEP_SECONDS,
+    defer_seconds=settings.AI_ENRICHMENT_DEFER_SECONDS,
+    max_rounds=settings.AI_ENRICHMENT_MAX_ROUNDS,
+)
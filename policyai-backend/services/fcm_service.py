@@ -1,10 +1,10 @@
 import os
-from typing import List
+from typing import Optional
 
 # Try to import Firebase, but don't crash if it's not available
 try:
     import firebase_admin
-    from firebase_admin import credentials, messaging
+    from firebase_admin import credentials, exceptions as firebase_exceptions, messaging
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
@@ -35,6 +35,32 @@ if FIREBASE_AVAILABLE and not firebase_admin._apps:
         print(f"⚠️ Firebase initialization failed: {e}")
 
 
+# How a per-token send error is treated by the dispatcher
+TOKEN_DEAD = "dead"  # Token will never work again; clear it
+TOKEN_FAILED = "failed"  # Counts towards quarantining the token
+SERVICE_ERROR = "service"  # FCM side problem; not the token's fault
+
+
+def classify_send_error(error: Exception) -> str:
+    """TOKEN_DEAD, TOKEN_FAILED or SERVICE_ERROR for a per-token send error"""
+    if not FIREBASE_AVAILABLE:
+        return TOKEN_FAILED
+    
+    if isinstance(error, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+        return TOKEN_DEAD
+    # INVALID_ARGUMENT also covers bad payloads, which say nothing about the token
+    if isinstance(error, firebase_exceptions.InvalidArgumentError) and "registration token" in str(error).lower():
+        return TOKEN_DEAD
+    if isinstance(error, (
+        firebase_exceptions.ResourceExhaustedError,
+        firebase_exceptions.UnavailableError,
+        firebase_exceptions.InternalError,
+        firebase_exceptions.DeadlineExceededError,
+    )):
+        return SERVICE_ERROR
+    return TOKEN_FAILED
+
+
 def send_notification_to_token(token: str, title: str, body: str, data: dict = None):
     """Send notification to a single device"""
     if not FIREBASE_AVAILABLE:
@@ -54,85 +80,31 @@ def send_notification_to_token(token: str, title: str, body: str, data: dict = N
         response = messaging.send(message)
         print(f"✅ Notification sent successfully: {response}")
         return True
-        
+    
     except Exception as e:
         print(f"❌ Error sending notification: {e}")
         return False
 
 
-def send_notification_to_multiple(tokens: List[str], title: str, body: str, data: dict = None):
-    """Send notification to multiple devices"""
-    if not FIREBASE_AVAILABLE:
-        print("⚠️ FCM not available, skipping notifications")
-        return None
+async def stream_fcm_tokens(category: Optional[str] = None):
+    """Token batches for a broadcast to every registered device.
     
-    try:
-        # ✅ FIX: Send individually instead of multicast
-        success_count = 0
-        failure_count = 0
-        
-        for token in tokens:
-            try:
-                message = messaging.Message(
-                    notification=messaging.Notification(
-                        title=title,
-                        body=body,
-                    ),
-                    data=data or {},
-                    token=token,
-                )
-                
-                response = messaging.send(message)
-                success_count += 1
-                
-            except Exception as e:
-                print(f"❌ Failed for token {token[:20]}...: {e}")
-                failure_count += 1
-        
-        print(f"✅ {success_count} notifications sent")
-        print(f"❌ {failure_count} notifications failed")
-        
-        # Return mock response object
-        class Response:
-            pass
-        resp = Response()
-        resp.success_count = success_count
-        resp.failure_count = failure_count
-        return resp
-        
-    except Exception as e:
-        print(f"❌ Error sending notifications: {e}")
-        return None
-
-
-def send_new_policy_notification(policy_title: str):
-    """Notify all users about new policy"""
-    if not FIREBASE_AVAILABLE:
-        print("⚠️ FCM not configured, skipping notification")
-        return
+    With a category, devices that chose other categories are left out, the
+    same audience its category topic reaches. Only the token column is read,
+    through a server-side cursor, so memory stays at one chunk however many
+    users there are.
+    """
+    from sqlalchemy import or_, select
+    from config import settings
+    from database import AsyncSessionLocal
+    from models.user import User
     
-    try:
-        from database import get_db
-        from models.user import User
-        
-        db = next(get_db())
-        
-        # Get all users with FCM tokens
-        users = db.query(User).filter(User.fcm_token.isnot(None)).all()
-        tokens = [user.fcm_token for user in users]
-        
-        if not tokens:
-            print("⚠️ No users with FCM tokens")
-            return
-        
-        send_notification_to_multiple(
-            tokens=tokens,
-            title="🗳️ New Policy Added!",
-            body=f"Vote now on: {policy_title}",
-            data={"type": "new_policy", "title": policy_title}
-        )
-    except Exception as e:
-        print(f"⚠️ Failed to send policy notification: {e}")
-
-
+    query = select(User.fcm_token).where(User.fcm_token.isnot(None), User.fcm_token_usable())
+    if category:
+        query = query.where(or_(User.notification_categories.is_(None), User.notification_categories.any(category)))
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=settings.FCM_TOKEN_CHUNK_SIZE))
+        async for chunk in result.scalars().partitions():
+            yield chunk
 
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.user import User
+
+
+class IdentityCache:
+    """Bounded LRU map of device_id -> user_id.
+    
+    Only ids read back from committed rows are cached; an id returned by our
+    own INSERT could still be rolled back with the request's transaction.
+    """
+    
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, device_id: str) -> Optional[int]:
+        with self._lock:
+            user_id = self._entries.get(device_id)
+            if user_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(device_id)
+            self.hits += 1
+            return user_id
+    
+    def put(self, device_id: str, user_id: int) -> None:
+        with self._lock:
+            self._entries[device_id] = user_id
+            self._entries.move_to_end(device_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+identity_cache = IdentityCache(max_entries=settings.IDENTITY_CACHE_MAX_ENTRIES)
+
+
+def default_user_name(device_id: str) -> str:
+    return f"User_{device_id[:8]}"
+
+
+async def resolve_user_id(db: AsyncSession, device_id: str, create: bool = True, name: Optional[str] = None) -> Optional[int]:
+    """Resolve a device_id to its user id.
+    
+    Served from the LRU cache when possible, otherwise by selecting only the
+    id column. With create=True a missing user is inserted with INSERT ... ON
+    CONFLICT (device_id) DO NOTHING, so concurrent first requests from one
+    device never fail on the unique index. Returns None if the user doesn't
+    exist and create is False.
+    """
+    user_id = identity_cache.get(device_id)
+    if user_id is not None:
+        return user_id
+    
+    user_id = (await db.execute(select(User.id).where(User.device_id == device_id))).scalar()
+    if user_id is not None:
+        identity_cache.put(device_id, user_id)
+        return user_id
+    
+    if not create:
+        return None
+    
+    user_id = (await db.execute(
+        pg_insert(User).values(
+            device_id=device_id, name=name or default_user_name(device_id)
+        ).on_conflict_do_nothing(
+            index_elements=[User.device_id]
+        ).returning(User.id)
+    )).scalar()
+    
+    if user_id is None:
+        # Another request created this device's user concurrently
+        user_id = (await db.execute(select(User.id).where(User.device_id == device_id))).scalar()
+        identity_cache.put(device_id, user_id)
+    
+    return user_id
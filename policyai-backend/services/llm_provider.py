@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import typing
+from abc import ABC, abstractmethod
+from typing import Optional, Type
+from pydantic import BaseModel
+from config import settings
+
+
+class LLMProvider(ABC):
+    """A model that answers a prompt with JSON matching a pydantic schema.
+    
+    agenerate_json is used on the event loop, generate_json from scripts and
+    worker threads.
+    """
+    
+    name = "base"
+    model = ""
+    
+    @abstractmethod
+    def generate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        ...
+    
+    async def agenerate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        return await asyncio.to_thread(self.generate_json, prompt, schema)
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through the google-genai client (sync and native async)"""
+    
+    name = "gemini"
+    
+    def __init__(self, api_key: str, model: str, timeout_seconds: Optional[float] = None):
+        from google import genai
+        from google.genai import types
+        
+        self.model = model
+        # HTTP level deadline, so calls from threads can't hang either
+        http_options = types.HttpOptions(timeout=int(timeout_seconds * 1000)) if timeout_seconds else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+    
+    def _config(self, schema: Type[BaseModel]):
+        from google.genai import types
+        
+        return types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=schema,
+        )
+    
+    def generate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        response = self.client.models.generate_content(model=self.model, contents=prompt, config=self._config(schema))
+        return response.text
+    
+    async def agenerate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        response = await self.client.aio.models.generate_content(model=self.model, contents=prompt, config=self._config(schema))
+        return response.text
+
+
+class StubProvider(LLMProvider):
+    """Offline stand-in for load tests and benchmarks.
+    
+    Replies are derived from a hash of the prompt, so the same prompt always
+    gets the same answer. Latency follows a lognormal distribution around
+    latency_ms (sigma controls the tail) and a failure_rate share of calls
+    raise, both drawn from an RNG seeded with seed so runs are repeatable.
+    """
+    
+    name = "stub"
+    model = "local-stub"
+    
+    def __init__(self, latency_ms: float = 800.0, latency_sigma: float = 0.5, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def _draw(self):
+        with self._lock:
+            latency = self.latency_ms * self._random.lognormvariate(0, self.latency_sigma) if self.latency_ms > 0 else 0.0
+            fails = self._random.random() < self.failure_rate
+        return latency / 1000, fails
+    
+    def _answer(self, prompt: str, schema: Type[BaseModel]) -> dict:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        answer = {}
+        for name, field in schema.model_fields.items():
+            if typing.get_origin(field.annotation) is list:
+                answer[name] = [f"Stub {name[:-1] or name} {i + 1} for prompt {digest[:8]}" for i in range(3)]
+            else:
+                answer[name] = f"Stub {name} for prompt {digest[:8]}."
+        return answer
+    
+    def generate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        delay, fails = self._draw()
+        time.sleep(delay)
+        if fails:
+            raise RuntimeError("Stub provider: simulated failure")
+        return json.dumps(self._answer(prompt, schema))
+    
+    async def agenerate_json(self, prompt: str, schema: Type[BaseModel]) -> str:
+        delay, fails = self._draw()
+        await asyncio.sleep(delay)
+        if fails:
+            raise RuntimeError("Stub provider: simulated failure")
+        return json.dumps(self._answer(prompt, schema))
+
+
+def get_provider() -> Optional[LLMProvider]:
+    """Provider selected by LLM_PROVIDER, or None when AI is unavailable"""
+    if settings.LLM_PROVIDER == "stub":
+        print(f"🧪 Using stub LLM provider (~{settings.LLM_STUB_LATENCY_MS:.0f} ms, {settings.LLM_STUB_FAILURE_RATE:.0%} failures)")
+        return StubProvider(
+            latency_ms=settings.LLM_STUB_LATENCY_MS,
+            latency_sigma=settings.LLM_STUB_LATENCY_SIGMA,
+            failure_rate=settings.LLM_STUB_FAILURE_RATE,
+            seed=settings.LLM_STUB_SEED,
+        )
+    
+    if settings.LLM_PROVIDER != "gemini":
+        print(f"⚠️ Unknown LLM_PROVIDER {settings.LLM_PROVIDER!r}, AI disabled")
+        return None
+    
+    if not settings.gemini_api_key:
+        print("⚠️ GEMINI_API_KEY not found in environment")
+        return None
+    
+    try:
+        provider = GeminiProvider(
+            api_key=settings.gemini_api_key,
+            model=settings.GEMINI_MODEL,
+            timeout_seconds=settings.AI_CALL_TIMEOUT_SECONDS,
+        )
+        print("✅ Gemini AI initialized successfully")
+        return provider
+    except Exception as e:
+        print(f"⚠️ Gemini AI initialization failed: {e}")
+        return None
@@ -0,0 +1,210 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+from weakref import WeakKeyDictionary
+from config import settings
+
+
+def _route_name(scope: dict) -> str:
+    """Route template of a request, e.g. "POST /api/policies/{policy_id}/vote" """
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path", "?")
+    return f"{scope.get('method', scope.get('type', '?'))} {path}"
+
+
+class LoopMonitor:
+    """Detects synchronous work stalling the event loop.
+    
+    A heartbeat task sleeps for interval_ms and measures how late it wakes up;
+    that delay is the loop lag. A watchdog thread notices when the heartbeat
+    has been silent for longer than threshold_ms and, while the loop is still
+    blocked, captures the loop thread's stack and the route of the task that
+    is running. When the heartbeat resumes the stall is recorded with its
+    measured duration, logged, and aggregated per route.
+    
+    Requests are attributed through LoopMonitorMiddleware, so stalls outside
+    a request (startup, background tasks) show up under "(no request)".
+    """
+    
+    def __init__(self, threshold_ms: float = 100.0, interval_ms: float = 20.0, max_recent: int = 50):
+        self.threshold_ms = threshold_ms
+        self.interval_ms = interval_ms
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        
+        # Running task -> ASGI scope, so the watchdog can name the blocked route
+        self._requests: "WeakKeyDictionary[asyncio.Task, dict]" = WeakKeyDictionary()
+        self._last_beat = 0.0
+        self._pending = None
+        
+        self._recent = deque(maxlen=max_recent)
+        self._routes = {}
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+    
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None and not self._heartbeat.done()
+    
+    def start(self) -> None:
+        """Start monitoring the running loop; call from a startup handler"""
+        if self.running:
+            return
+        
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        
+        self._heartbeat = self._loop.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        print(f"🩺 Event loop monitor started (threshold {self.threshold_ms:.0f} ms)")
+    
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+    
+    def track(self, task: asyncio.Task, scope: dict) -> None:
+        self._requests[task] = scope
+    
+    def untrack(self, task: asyncio.Task) -> None:
+        self._requests.pop(task, None)
+    
+    async def _beat(self) -> None:
+        interval = self.interval_ms / 1000
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self._last_beat = now
+            
+            with self._lock:
+                sample, self._pending = self._pending, None
+            
+            lag_ms = (now - started - interval) * 1000
+            if lag_ms >= self.threshold_ms:
+                self._record(lag_ms, sample)
+    
+    def _watch(self) -> None:
+        """Watchdog thread: snapshot the loop while it is blocked"""
+        check_every = self.interval_ms / 2000
+        threshold = self.threshold_ms / 1000
+        
+        while not self._stopped.wait(check_every):
+            if time.monotonic() - self._last_beat < threshold:
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    continue  # Already captured this stall
+                self._pending = self._snapshot()
+    
+    def _snapshot(self) -> dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame, limit=25) if frame is not None else []
+        
+        task = asyncio.current_task(self._loop)
+        scope = self._requests.get(task) if task is not None else None
+        return {
+            "route": _route_name(scope) if scope is not None else "(no request)",
+            "stack": "".join(stack),
+        }
+    
+    def _record(self, lag_ms: float, sample: Optional[dict]) -> None:
+        route = sample["route"] if sample else "(unknown)"
+        stack = sample["stack"] if sample else ""
+        
+        with self._lock:
+            self.stalls += 1
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            
+            stats = self._routes.setdefault(route, {"stalls": 0, "total_ms": 0.0, "max_ms": 0.0, "stack": ""})
+            stats["stalls"] += 1
+            stats["total_ms"] += lag_ms
+            if lag_ms >= stats["max_ms"]:
+                stats["max_ms"] = lag_ms
+                stats["stack"] = stack
+            
+            self._recent.append({
+                "at": time.time(),
+                "route": route,
+                "lag_ms": round(lag_ms, 1),
+                "stack": stack,
+            })
+        
+        print(f"🐢 Event loop blocked for {lag_ms:.0f} ms in {route}")
+        if stack:
+            print(stack.rstrip())
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._routes.clear()
+            self.stalls = 0
+            self.max_lag_ms = 0.0
+    
+    def stats(self) -> dict:
+        with self._lock:
+            offenders = sorted(self._routes.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+            return {
+                "enabled": self.running,
+                "threshold_ms": self.threshold_ms,
+                "interval_ms": self.interval_ms,
+                "stalls": self.stalls,
+                "max_lag_ms": round(self.max_lag_ms, 1),
+                "routes": [
+                    {
+                        "route": route,
+                        "stalls": stats["stalls"],
+                        "total_ms": round(stats["total_ms"], 1),
+                        "max_ms": round(stats["max_ms"], 1),
+                        "worst_stack": stats["stack"],
+                    }
+                    for route, stats in offenders
+                ],
+                "recent": list(self._recent),
+            }
+
+
+class LoopMonitorMiddleware:
+    """Pure ASGI middleware mapping the request's task to its scope.
+    
+    Pure ASGI (not BaseHTTPMiddleware) so the endpoint runs in the same task
+    the monitor looks up.
+    """
+    
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        task = asyncio.current_task()
+        self.monitor.track(task, scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.untrack(task)
+
+
+loop_monitor = LoopMonitor(
+    threshold_ms=settings.LOOP_MONITOR_THRESHOLD_MS,
+    interval_ms=settings.LOOP_MONITOR_INTERVAL_MS,
+)
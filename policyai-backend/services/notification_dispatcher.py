@@ -0,0 +1,220 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import AsyncIterator, Callable, List
+from sqlalchemy import case, func, update
+from config import settings
+from database import AsyncSessionLocal
+from models.user import User
+from services import fcm_service
+
+# FCM accepts at most 500 tokens per multicast request
+FCM_MAX_BATCH_SIZE = 500
+
+
+@dataclass
+class Broadcast:
+    """A notification for every token produced by tokens()"""
+    kind: str
+    title: str
+    body: str
+    tokens: Callable[[], AsyncIterator[List[str]]]
+    data: dict = field(default_factory=dict)
+
+
+class NotificationDispatcher:
+    """Fans a broadcast out to every token, for the notification outbox.
+    
+    Tokens are sent with FCM's multicast API, batch_size per request, with at
+    most max_parallel_batches requests in flight. Each run's success and
+    failure counts and throughput are kept for /health/notifications.
+    
+    Per-token errors are classified after every request: dead tokens are
+    cleared from users.fcm_token, and a token that fails
+    quarantine_after_failures sends in a row is skipped by broadcasts for
+    quarantine_seconds. A successful send resets the count.
+    """
+    
+    def __init__(
+        self,
+        batch_size: int = FCM_MAX_BATCH_SIZE,
+        max_parallel_batches: int = 4,
+        quarantine_after_failures: int = 3,
+        quarantine_seconds: int = 86400,
+        max_recent_runs: int = 20,
+    ):
+        self.batch_size = min(batch_size, FCM_MAX_BATCH_SIZE)
+        self.max_parallel_batches = max_parallel_batches
+        self.quarantine_after_failures = quarantine_after_failures
+        self.quarantine_seconds = quarantine_seconds
+        
+        self._recent_runs = deque(maxlen=max_recent_runs)
+        
+        self.runs = 0
+        self.sent = 0
+        self.failed = 0
+        self.removed = 0
+        self.quarantined = 0
+    
+    async def _send_batch(self, tokens: List[str], broadcast: Broadcast):
+        """Per-token responses for one multicast request, None if the request failed"""
+        message = fcm_service.messaging.MulticastMessage(
+            tokens=tokens,
+            notification=fcm_service.messaging.Notification(title=broadcast.title, body=broadcast.body),
+            data=broadcast.data,
+        )
+        try:
+            response = await fcm_service.messaging.send_each_for_multicast_async(message)
+        except Exception as e:
+            print(f"❌ Multicast of {len(tokens)} notifications failed: {e}")
+            return None
+        return response.responses
+    
+    async def _record_token_health(self, succeeded: List[str], dead: List[str], failing: List[str]) -> int:
+        """Apply one batch's outcomes to users; returns how many tokens were quarantined"""
+        quarantined = 0
+        async with AsyncSessionLocal() as db:
+            if dead:
+                await db.execute(
+                    update(User).where(User.fcm_token.in_(dead)).values(
+                        fcm_token=None,
+                        fcm_failure_count=0,
+                        fcm_quarantined_until=None,
+                    ).execution_options(synchronize_session=False)
+                )
+            
+            if failing:
+                failures = User.fcm_failure_count + 1
+                result = await db.execute(
+                    update(User).where(User.fcm_token.in_(failing)).values(
+                        fcm_failure_count=failures,
+                        fcm_quarantined_until=case(
+                            (failures >= self.quarantine_after_failures, func.now() + timedelta(seconds=self.quarantine_seconds)),
+                            else_=User.fcm_quarantined_until,
+                        ),
+                    ).returning(User.fcm_failure_count).execution_options(synchronize_session=False)
+                )
+                quarantined = sum(1 for count in result.scalars() if count >= self.quarantine_after_failures)
+            
+            if succeeded:
+                # Only touches rows that have something to reset
+                await db.execute(
+                    update(User).where(User.fcm_token.in_(succeeded), User.fcm_failure_count > 0).values(
+                        fcm_failure_count=0,
+                        fcm_quarantined_until=None,
+                    ).execution_options(synchronize_session=False)
+                )
+            
+            await db.commit()
+        return quarantined
+    
+    async def fan_out(self, broadcast: Broadcast) -> dict:
+        """Send broadcast to all of its tokens and return the run's counts"""
+        run = {"kind": broadcast.kind, "tokens": 0, "batches": 0, "success": 0, "failure": 0, "removed": 0, "quarantined": 0}
+        if not fcm_service.FIREBASE_AVAILABLE:
+            print("⚠️ FCM not configured, skipping notification")
+            return run
+        
+        started = time.monotonic()
+        slots = asyncio.Semaphore(self.max_parallel_batches)
+        pending = set()
+        
+        async def send(batch):
+            try:
+                responses = await self._send_batch(batch, broadcast)
+                if responses is None:
+                    # The request itself failed; nothing is known about the tokens
+                    run["failure"] += len(batch)
+                    return
+                
+                succeeded, dead, failing = [], [], []
+                for token, response in zip(batch, responses):
+                    if response.success:
+                        succeeded.append(token)
+                        continue
+                    
+                    kind = fcm_service.classify_send_error(response.exception)
+                    if kind == fcm_service.TOKEN_DEAD:
+                        dead.append(token)
+                    elif kind == fcm_service.TOKEN_FAILED:
+                        failing.append(token)
+                
+                run["success"] += len(succeeded)
+                run["failure"] += len(batch) - len(succeeded)
+                try:
+                    run["quarantined"] += await self._record_token_health(succeeded, dead, failing)
+                    run["removed"] += len(dead)
+                except Exception as e:
+                    print(f"⚠️ Could not update FCM token health: {e}")
+            finally:
+                slots.release()
+        
+        async def dispatch(batch):
+            await slots.acquire()
+            task = asyncio.create_task(send(batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            run["tokens"] += len(batch)
+            run["batches"] += 1
+        
+        try:
+            # Chunks from tokens() are re-cut so every request but the last is full
+            buffered: List[str] = []
+            # aclosing: the token source's session is released even if sending stops early
+            async with aclosing(broadcast.tokens()) as chunks:
+                async for chunk in chunks:
+                    buffered.extend(chunk)
+                    while len(buffered) >= self.batch_size:
+                        batch, buffered = buffered[:self.batch_size], buffered[self.batch_size:]
+                        await dispatch(batch)
+            if buffered:
+                await dispatch(buffered)
+        finally:
+            # Let batches already sent finish even if reading tokens failed
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        seconds = time.monotonic() - started
+        run.update(
+            finished_at=time.time(),
+            seconds=round(seconds, 3),
+            per_second=round(run["tokens"] / seconds, 1) if seconds else 0.0,
+        )
+        self._recent_runs.append(run)
+        self.runs += 1
+        self.sent += run["success"]
+        self.failed += run["failure"]
+        self.removed += run["removed"]
+        self.quarantined += run["quarantined"]
+        
+        print(
+            f"📣 {broadcast.kind}: {run['success']} sent, {run['failure']} failed "
+            f"in {run['batches']} batches ({run['per_second']}/s); "
+            f"{run['removed']} dead tokens removed, {run['quarantined']} quarantined"
+        )
+        return run
+    
+    def stats(self) -> dict:
+        return {
+            "batch_size": self.batch_size,
+            "max_parallel_batches": self.max_parallel_batches,
+            "quarantine_after_failures": self.quarantine_after_failures,
+            "quarantine_seconds": self.quarantine_seconds,
+            "runs": self.runs,
+            "sent": self.sent,
+            "failed": self.failed,
+            "removed": self.removed,
+            "quarantined": self.quarantined,
+            "recent_runs": list(self._recent_runs),
+        }
+
+
+notification_dispatcher = NotificationDispatcher(
+    batch_size=settings.FCM_BATCH_SIZE,
+    max_parallel_batches=settings.FCM_MAX_PARALLEL_BATCHES,
+    quarantine_after_failures=settings.FCM_QUARANTINE_AFTER_FAILURES,
+    quarantine_seconds=settings.FCM_QUARANTINE_SECONDS,
+)
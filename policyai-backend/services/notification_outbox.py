@@ -0,0 +1,296 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import List, Optional
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import AsyncSessionLocal
+from models.notification_outbox import NotificationOutbox
+from services import fcm_service
+from services.notification_dispatcher import Broadcast, notification_dispatcher
+from services.topic_subscriptions import GLOBAL_TOPIC, category_topic
+
+# Outbox row lifecycle: pending -> processing -> sent | failed
+PENDING = "pending"
+PROCESSING = "processing"
+SENT = "sent"
+FAILED = "failed"
+
+# FCM accepts at most 500 messages per send_each request
+FCM_MAX_MESSAGES_PER_REQUEST = 500
+
+
+async def enqueue_new_policy(db: AsyncSession, policy_id: int, title: str, category: str) -> None:
+    """Queue the new-policy notification in db's transaction; the caller commits.
+    
+    With topics there is one row per topic, so a failed topic is retried on
+    its own. Rows whose dedupe key exists already are skipped, so queueing
+    the same policy twice is a no-op.
+    """
+    key = f"new_policy:{policy_id}"
+    payload = {
+        "title": "🗳️ New Policy Added!",
+        "body": f"Vote now on: {title}",
+        "data": {"type": "new_policy", "title": title, "policy_id": str(policy_id)},
+    }
+    
+    if settings.FCM_USE_TOPICS:
+        rows = [
+            {"dedupe_key": f"{key}:{topic}", "kind": "new_policy", "payload": {**payload, "topic": topic}}
+            for topic in [GLOBAL_TOPIC, category_topic(category)]
+        ]
+    else:
+        rows = [{"dedupe_key": key, "kind": "new_policy", "payload": {**payload, "category": category}}]
+    
+    await db.execute(
+        pg_insert(NotificationOutbox).values(rows)
+        .on_conflict_do_nothing(index_elements=[NotificationOutbox.dedupe_key])
+    )
+
+
+async def outbox_counts(db: AsyncSession) -> dict:
+    """Rows per status"""
+    rows = await db.execute(
+        select(NotificationOutbox.status, func.count()).group_by(NotificationOutbox.status)
+    )
+    return {status: count for status, count in rows}
+
+
+# Settles one claimed row; executed once per batch with a list of parameter sets
+_settle_row = NotificationOutbox.__table__.update().where(
+    NotificationOutbox.__table__.c.id == bindparam("row_id")
+).values(
+    status=bindparam("new_status"),
+    next_attempt_at=bindparam("retry_at"),
+    last_error=bindparam("error"),
+    sent_at=bindparam("sent"),
+)
+
+
+class OutboxWorker:
+    """Delivers notification_outbox rows.
+    
+    Each round claims up to batch_size due rows with FOR UPDATE SKIP LOCKED,
+    so any number of workers can run side by side, and leases them for
+    lease_seconds. The lease is renewed every lease_seconds / 3 while the
+    batch is sending, so a long token fan-out is never claimed by a second
+    worker; only a worker that dies mid-batch leaves rows that are claimed
+    again once the lease runs out (delivery is at least once, so those
+    devices may get the notification twice). Topic messages of a batch go
+    out in one send_each request. Failed rows are retried after
+    retry_backoff_seconds * 2^(attempt - 1) until max_attempts is reached.
+    """
+    
+    def __init__(
+        self,
+        batch_size: int = 100,
+        poll_seconds: float = 1.0,
+        max_attempts: int = 5,
+        retry_backoff_seconds: float = 5.0,
+        lease_seconds: float = 120.0,
+    ):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.lease_seconds = lease_seconds
+        
+        self._task: Optional[asyncio.Task] = None
+        
+        self.batches = 0
+        self.claimed = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.renewals = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self.run())
+        print("📬 Notification outbox worker started")
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def claim(self, db: AsyncSession) -> list:
+        """Lease up to batch_size due rows to this worker"""
+        due = (
+            select(NotificationOutbox.id)
+            .where(
+                NotificationOutbox.status.in_([PENDING, PROCESSING]),
+                NotificationOutbox.next_attempt_at <= func.now(),
+            )
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+            .values(
+                status=PROCESSING,
+                attempts=NotificationOutbox.attempts + 1,
+                next_attempt_at=func.now() + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(NotificationOutbox.id, NotificationOutbox.kind, NotificationOutbox.payload, NotificationOutbox.attempts)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        await db.commit()
+        return rows
+    
+    async def _renew_leases(self, row_ids: List[int]) -> None:
+        """Keep extending the lease on row_ids until cancelled"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(NotificationOutbox)
+                        .where(NotificationOutbox.id.in_(row_ids), NotificationOutbox.status == PROCESSING)
+                        .values(next_attempt_at=func.now() + timedelta(seconds=self.lease_seconds))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+                self.renewals += 1
+            except Exception as e:
+                print(f"⚠️ Renewing notification outbox leases failed: {e}")
+    
+    def _message(self, payload: dict):
+        return fcm_service.messaging.Message(
+            topic=payload["topic"],
+            notification=fcm_service.messaging.Notification(title=payload["title"], body=payload["body"]),
+            data=payload.get("data") or {},
+        )
+    
+    async def _send(self, rows: list) -> List[Optional[str]]:
+        """Error per row, None for rows that were delivered"""
+        errors: List[Optional[str]] = [None] * len(rows)
+        
+        topic_rows = [i for i, row in enumerate(rows) if row.payload.get("topic")]
+        for start in range(0, len(topic_rows), FCM_MAX_MESSAGES_PER_REQUEST):
+            chunk = topic_rows[start:start + FCM_MAX_MESSAGES_PER_REQUEST]
+            try:
+                response = await fcm_service.messaging.send_each_async([self._message(rows[i].payload) for i in chunk])
+            except Exception as e:
+                for i in chunk:
+                    errors[i] = str(e) or type(e).__name__
+                continue
+            for i, result in zip(chunk, response.responses):
+                if not result.success:
+                    errors[i] = str(result.exception) or type(result.exception).__name__
+        
+        # Rows without a topic are sent to every token (that wants the category)
+        for i, row in enumerate(rows):
+            if row.payload.get("topic"):
+                continue
+            try:
+                run = await notification_dispatcher.fan_out(Broadcast(
+                    kind=row.kind,
+                    title=row.payload["title"],
+                    body=row.payload["body"],
+                    data=row.payload.get("data") or {},
+                    tokens=partial(fcm_service.stream_fcm_tokens, row.payload.get("category")),
+                ))
+            except Exception as e:
+                errors[i] = str(e) or type(e).__name__
+                continue
+            # Per-token failures are handled by token pruning; only retry a run nothing got through
+            if run["tokens"] and not run["success"]:
+                errors[i] = f"all {run['tokens']} sends failed"
+        
+        return errors
+    
+    async def _settle(self, db: AsyncSession, rows: list, errors: List[Optional[str]]) -> None:
+        now = datetime.now(timezone.utc)
+        params = []
+        for row, error in zip(rows, errors):
+            if error is None:
+                self.sent += 1
+                params.append({"row_id": row.id, "new_status": SENT, "retry_at": now, "error": None, "sent": now})
+            elif row.attempts >= self.max_attempts:
+                self.failed += 1
+                print(f"❌ Notification {row.id} failed after {row.attempts} attempts: {error}")
+                params.append({"row_id": row.id, "new_status": FAILED, "retry_at": now, "error": error, "sent": None})
+            else:
+                self.retried += 1
+                delay = self.retry_backoff_seconds * 2 ** (row.attempts - 1)
+                params.append({
+                    "row_id": row.id,
+                    "new_status": PENDING,
+                    "retry_at": now + timedelta(seconds=delay),
+                    "error": error,
+                    "sent": None,
+                })
+        
+        await db.execute(_settle_row, params)
+        await db.commit()
+    
+    async def run_once(self) -> int:
+        """Claim, send and settle one batch; returns how many rows it held"""
+        async with AsyncSessionLocal() as db:
+            rows = await self.claim(db)
+            if not rows:
+                return 0
+            
+            self.batches += 1
+            self.claimed += len(rows)
+            renewer = asyncio.create_task(self._renew_leases([row.id for row in rows]))
+            try:
+                errors = await self._send(rows)
+            finally:
+                renewer.cancel()
+                await asyncio.gather(renewer, return_exceptions=True)
+            await self._settle(db, rows, errors)
+        
+        delivered = sum(error is None for error in errors)
+        print(f"📬 Outbox batch: {delivered} of {len(rows)} notifications delivered")
+        return len(rows)
+    
+    async def run(self) -> None:
+        if not fcm_service.FIREBASE_AVAILABLE:
+            print("⚠️ FCM not configured, notification outbox worker not running")
+            return
+        
+        while True:
+            try:
+                handled = await self.run_once()
+            except Exception as e:
+                print(f"❌ Notification outbox round failed: {e}")
+                handled = 0
+            
+            # Keep draining while batches come back full
+            if handled < self.batch_size:
+                await asyncio.sleep(self.poll_seconds)
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "batch_size": self.batch_size,
+            "max_attempts": self.max_attempts,
+            "batches": self.batches,
+            "claimed": self.claimed,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "renewals": self.renewals,
+        }
+
+
+outbox_worker = OutboxWorker(
+    batch_size=settings.NOTIFICATION_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.NOTIFICATION_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+    retry_backoff_seconds=settings.NOTIFICATION_OUTBOX_RETRY_BACKOFF_SECONDS,
+    lease_seconds=settings.NOTIFICATION_OUTBOX_LEASE_SECONDS,
+)
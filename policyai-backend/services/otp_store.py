@@ -0,0 +1,224 @@
+import hashlib
+import heapq
+import hmac
+import time
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import settings
+from database import AsyncSessionLocal
+from models.otp_code import OTPCode
+
+# Outcomes of OTPStore.verify
+VERIFIED = "verified"
+MISMATCH = "mismatch"
+EXPIRED = "expired"  # Also returned when there is no code for the email
+LOCKED = "locked"  # Too many wrong guesses; the code was discarded
+
+
+def _code_hash(email: str, otp: str) -> str:
+    """Keyed hash, so stored codes are useless without SECRET_KEY"""
+    return hmac.new(settings.SECRET_KEY.encode(), f"{email}:{otp}".encode(), hashlib.sha256).hexdigest()
+
+
+class OTPStore(ABC):
+    """Where login OTPs live between send-otp and verify-otp.
+    
+    verify consumes the code on success, and after max_attempts wrong
+    guesses the code is discarded so it can't be brute forced.
+    """
+    
+    name = "base"
+    
+    def __init__(self, max_attempts: int = 5):
+        self.max_attempts = max_attempts
+        
+        self.stored = 0
+        self.verified = 0
+        self.rejected = 0
+        self.locked = 0
+    
+    @abstractmethod
+    async def put(self, email: str, otp: str, ttl_seconds: float) -> None:
+        ...
+    
+    @abstractmethod
+    async def verify(self, email: str, otp: str) -> str:
+        """VERIFIED, MISMATCH, EXPIRED or LOCKED"""
+    
+    def _count(self, outcome: str) -> str:
+        if outcome == VERIFIED:
+            self.verified += 1
+        else:
+            self.rejected += 1
+            if outcome == LOCKED:
+                self.locked += 1
+        return outcome
+    
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "max_attempts": self.max_attempts,
+            "stored": self.stored,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "locked": self.locked,
+        }
+
+
+class MemoryOTPStore(OTPStore):
+    """Per-process store for a single worker.
+    
+    Expired codes are evicted through a heap ordered by expiry on every put,
+    and at most max_entries codes are kept (the soonest to expire go first),
+    so the store can't grow without bound. Nothing awaits between reading
+    and consuming a code, which makes verify atomic on the event loop.
+    """
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int = 10000, max_attempts: int = 5):
+        super().__init__(max_attempts=max_attempts)
+        self.max_entries = max_entries
+        
+        # email -> [code_hash, expires_at, attempts]
+        self._codes: Dict[str, list] = {}
+        # (expires_at, email); entries superseded by a newer put are skipped
+        self._expiry: List[Tuple[float, str]] = []
+        
+        self.evicted = 0
+    
+    def _evict(self, now: float) -> None:
+        while self._expiry and (self._expiry[0][0] <= now or len(self._codes) > self.max_entries):
+            expires_at, email = heapq.heappop(self._expiry)
+            entry = self._codes.get(email)
+            if entry is not None and entry[1] == expires_at:
+                del self._codes[email]
+                self.evicted += 1
+    
+    async def put(self, email: str, otp: str, ttl_seconds: float) -> None:
+        now = time.monotonic()
+        expires_at = now + ttl_seconds
+        self._codes[email] = [_code_hash(email, otp), expires_at, 0]
+        heapq.heappush(self._expiry, (expires_at, email))
+        self._evict(now)
+        self.stored += 1
+    
+    async def verify(self, email: str, otp: str) -> str:
+        entry = self._codes.get(email)
+        if entry is None or entry[1] <= time.monotonic():
+            self._codes.pop(email, None)
+            return self._count(EXPIRED)
+        
+        if hmac.compare_digest(entry[0], _code_hash(email, otp)):
+            del self._codes[email]
+            return self._count(VERIFIED)
+        
+        entry[2] += 1
+        if entry[2] >= self.max_attempts:
+            del self._codes[email]
+            return self._count(LOCKED)
+        return self._count(MISMATCH)
+    
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "entries": len(self._codes),
+            "max_entries": self.max_entries,
+            "evicted": self.evicted,
+        }
+
+
+class PostgresOTPStore(OTPStore):
+    """Store in the otp_codes table, shared by every worker and process.
+    
+    verify consumes a matching code with a single conditional DELETE, so two
+    concurrent verifications can't both succeed; a wrong guess bumps the
+    attempts counter in one UPDATE. Expired rows are pruned at most every
+    prune_seconds, piggybacking on put.
+    """
+    
+    name = "postgres"
+    
+    def __init__(self, max_attempts: int = 5, prune_seconds: float = 60.0):
+        super().__init__(max_attempts=max_attempts)
+        self.prune_seconds = prune_seconds
+        self._last_prune = 0.0
+        
+        self.pruned = 0
+    
+    async def put(self, email: str, otp: str, ttl_seconds: float) -> None:
+        values = {
+            "email": email,
+            "code_hash": _code_hash(email, otp),
+            "expires_at": func.now() + timedelta(seconds=ttl_seconds),
+            "attempts": 0,
+        }
+        statement = pg_insert(OTPCode).values(**values)
+        
+        async with AsyncSessionLocal() as db:
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[OTPCode.email],
+                set_={name: statement.excluded[name] for name in ("code_hash", "expires_at", "attempts")},
+            ))
+            
+            now = time.monotonic()
+            if now - self._last_prune >= self.prune_seconds:
+                self._last_prune = now
+                result = await db.execute(delete(OTPCode).where(OTPCode.expires_at <= func.now()))
+                self.pruned += result.rowcount
+            
+            await db.commit()
+        self.stored += 1
+    
+    async def verify(self, email: str, otp: str) -> str:
+        async with AsyncSessionLocal() as db:
+            consumed = (await db.execute(
+                delete(OTPCode).where(
+                    OTPCode.email == email,
+                    OTPCode.code_hash == _code_hash(email, otp),
+                    OTPCode.expires_at > func.now(),
+                    OTPCode.attempts < self.max_attempts,
+                ).returning(OTPCode.email).execution_options(synchronize_session=False)
+            )).first()
+            
+            if consumed is not None:
+                await db.commit()
+                return self._count(VERIFIED)
+            
+            attempts = (await db.execute(
+                update(OTPCode).where(
+                    OTPCode.email == email,
+                    OTPCode.expires_at > func.now(),
+                ).values(attempts=OTPCode.attempts + 1).returning(OTPCode.attempts)
+                .execution_options(synchronize_session=False)
+            )).scalar()
+            
+            if attempts is None:
+                outcome = EXPIRED
+            elif attempts >= self.max_attempts:
+                await db.execute(delete(OTPCode).where(OTPCode.email == email))
+                outcome = LOCKED
+            else:
+                outcome = MISMATCH
+            
+            await db.commit()
+        return self._count(outcome)
+    
+    def stats(self) -> dict:
+        return {**super().stats(), "pruned": self.pruned}
+
+
+def get_otp_store() -> OTPStore:
+    """Store selected by OTP_STORE"""
+    if settings.OTP_STORE == "postgres":
+        return PostgresOTPStore(max_attempts=settings.OTP_MAX_ATTEMPTS)
+    
+    if settings.OTP_STORE != "memory":
+        print(f"⚠️ Unknown OTP_STORE {settings.OTP_STORE!r}, using memory")
+    return MemoryOTPStore(max_entries=settings.OTP_MEMORY_MAX_ENTRIES, max_attempts=settings.OTP_MAX_ATTEMPTS)
+
+
+otp_store = get_otp_store()
@@ -0,0 +1,51 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import HTTPException
+
+
+def encode_cursor(sort: str, values: list) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor"""
+    payload = {
+        "s": sort,
+        "k": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], sort: str, key_types: tuple) -> Optional[List]:
+    """Decode a cursor produced by encode_cursor for the same sort mode.
+    
+    key_types gives the type of each sort key value (int or datetime); the
+    cursor must hold exactly those, and datetimes are parsed back so they can
+    be compared against timestamp columns. Raises 400 for tampered or stale
+    cursors.
+    """
+    if not cursor:
+        return None
+    
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload["s"] != sort:
+            raise ValueError("cursor belongs to a different sort")
+        
+        values = list(payload["k"])
+        if len(values) != len(key_types):
+            raise ValueError("cursor has the wrong number of values")
+        
+        for position, key_type in enumerate(key_types):
+            value = values[position]
+            if key_type is datetime:
+                values[position] = datetime.fromisoformat(value)
+                if values[position].tzinfo is None:
+                    raise ValueError("cursor timestamp has no timezone")
+            elif not isinstance(value, key_type) or isinstance(value, bool):
+                raise ValueError("cursor value has the wrong type")
+        return values
+        
+    except (binascii.Error, ValueError, KeyError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
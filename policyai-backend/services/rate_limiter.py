@@ -0,0 +1,209 @@
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import delete, func, text
+from config import settings
+from database import AsyncSessionLocal
+from models.rate_limit_bucket import RateLimitBucket
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Token bucket: bursts of up to capacity requests, refilled at per_minute"""
+    name: str
+    capacity: float
+    per_minute: float
+    
+    @property
+    def per_second(self) -> float:
+        return self.per_minute / 60
+
+
+class MemoryBuckets:
+    """Per-process buckets, at most max_keys of them (least recently used go
+    first; a dropped bucket simply starts full again). Nothing awaits between
+    reading and updating a bucket, so take is atomic on the event loop."""
+    
+    name = "memory"
+    
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> [tokens, updated_at]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+    
+    async def take(self, key: str, policy: RateLimitPolicy, cost: float) -> Tuple[bool, float]:
+        """(allowed, tokens left) after trying to take cost tokens"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [policy.capacity, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        
+        tokens = min(policy.capacity, bucket[0] + (now - bucket[1]) * policy.per_second)
+        allowed = tokens >= cost
+        bucket[0] = tokens - cost if allowed else tokens
+        bucket[1] = now
+        return allowed, bucket[0]
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "keys": len(self._buckets), "max_keys": self.max_keys}
+
+
+# Bucket level after refilling for the time since the last request
+_REFILLED = "LEAST(CAST(:capacity AS float8), b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * CAST(:per_second AS float8))"
+
+# Refill, take and report in one statement; the row lock serializes workers
+_take = text(f"""
+    INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+    VALUES (:key, CAST(:capacity AS float8) - CAST(:cost AS float8), true, now())
+    ON CONFLICT (key) DO UPDATE SET
+        allowed = {_REFILLED} >= CAST(:cost AS float8),
+        tokens = CASE
+            WHEN {_REFILLED} >= CAST(:cost AS float8) THEN {_REFILLED} - CAST(:cost AS float8)
+            ELSE {_REFILLED}
+        END,
+        updated_at = now()
+    RETURNING allowed, tokens
+""")
+
+
+class PostgresBuckets:
+    """Buckets in the rate_limit_buckets table, shared by every worker.
+    
+    Buckets idle for prune_after_seconds are full again and are deleted at
+    most every prune_seconds, piggybacking on take.
+    """
+    
+    name = "postgres"
+    
+    def __init__(self, prune_seconds: float = 300.0, prune_after_seconds: float = 3600.0):
+        self.prune_seconds = prune_seconds
+        self.prune_after_seconds = prune_after_seconds
+        self._last_prune = time.monotonic()
+        
+        self.pruned = 0
+    
+    async def take(self, key: str, policy: RateLimitPolicy, cost: float) -> Tuple[bool, float]:
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(_take, {
+                "key": key,
+                "capacity": policy.capacity,
+                "per_second": policy.per_second,
+                "cost": cost,
+            })).one()
+            
+            now = time.monotonic()
+            if now - self._last_prune >= self.prune_seconds:
+                self._last_prune = now
+                result = await db.execute(delete(RateLimitBucket).where(
+                    RateLimitBucket.updated_at < func.now() - timedelta(seconds=self.prune_after_seconds)
+                ))
+                self.pruned += result.rowcount
+            
+            await db.commit()
+        return row.allowed, row.tokens
+    
+    def stats(self) -> dict:
+        return {"backend": self.name, "pruned": self.pruned}
+
+
+def client_ip(request: Request) -> str:
+    """Client address; behind the platform proxy the last X-Forwarded-For hop
+    is the one the proxy itself saw (earlier ones are client supplied)"""
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    """Per-route token-bucket policies over a memory or shared backend.
+    
+    enforce raises a 429 with Retry-After before the route does any real
+    work. If the backend itself fails the request is let through (and
+    counted), so a database hiccup doesn't lock everyone out.
+    """
+    
+    def __init__(self, backend, policies: Dict[str, RateLimitPolicy], enabled: bool = True):
+        self.backend = backend
+        self.policies = policies
+        self.enabled = enabled
+        
+        self.allowed: Dict[str, int] = {name: 0 for name in policies}
+        self.rejected: Dict[str, int] = {name: 0 for name in policies}
+        self.errors = 0
+    
+    async def check(self, policy_name: str, key: str, cost: float = 1) -> float:
+        """0 if the request may go ahead, otherwise seconds until it may"""
+        if not self.enabled:
+            return 0.0
+        
+        policy = self.policies[policy_name]
+        try:
+            allowed, tokens = await self.backend.take(f"{policy_name}:{key}", policy, cost)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Rate limit check failed, allowing request: {e}")
+            return 0.0
+        
+        if allowed:
+            self.allowed[policy_name] += 1
+            return 0.0
+        
+        self.rejected[policy_name] += 1
+        if policy.per_second <= 0:
+            return float("inf")
+        return (cost - tokens) / policy.per_second
+    
+    async def enforce(self, policy_name: str, key: str, cost: float = 1) -> None:
+        retry_after = await self.check(policy_name, key, cost)
+        if retry_after:
+            seconds = max(1, math.ceil(retry_after)) if math.isfinite(retry_after) else 3600
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": str(seconds)},
+            )
+    
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            **self.backend.stats(),
+            "policies": {
+                name: {
+                    "capacity": policy.capacity,
+                    "per_minute": policy.per_minute,
+                    "allowed": self.allowed[name],
+                    "rejected": self.rejected[name],
+                }
+                for name, policy in self.policies.items()
+            },
+            "errors": self.errors,
+        }
+
+
+def _policies() -> Dict[str, RateLimitPolicy]:
+    return {
+        "send_otp_email": RateLimitPolicy("send_otp_email", settings.RATE_LIMIT_SEND_OTP_BURST, settings.RATE_LIMIT_SEND_OTP_PER_MINUTE),
+        "send_otp_ip": RateLimitPolicy("send_otp_ip", settings.RATE_LIMIT_SEND_OTP_IP_BURST, settings.RATE_LIMIT_SEND_OTP_IP_PER_MINUTE),
+        "vote": RateLimitPolicy("vote", settings.RATE_LIMIT_VOTE_BURST, settings.RATE_LIMIT_VOTE_PER_MINUTE),
+        "comment": RateLimitPolicy("comment", settings.RATE_LIMIT_COMMENT_BURST, settings.RATE_LIMIT_COMMENT_PER_MINUTE),
+    }
+
+
+def _backend():
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        return PostgresBuckets()
+    if settings.RATE_LIMIT_BACKEND != "memory":
+        print(f"⚠️ Unknown RATE_LIMIT_BACKEND {settings.RATE_LIMIT_BACKEND!r}, using memory")
+    return MemoryBuckets(max_keys=settings.RATE_LIMIT_MEMORY_MAX_KEYS)
+
+
+rate_limiter = RateLimiter(_backend(), _policies(), enabled=settings.RATE_LIMIT_ENABLED)
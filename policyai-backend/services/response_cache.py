@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from config import settings
+
+
+class ResponseCache:
+    """Bounded in-process cache for read-heavy API responses.
+    
+    Entries expire after ttl_seconds and the least recently used entry is
+    evicted once max_entries is reached. Concurrent misses on the same key are
+    coalesced so only one caller runs the loader (single flight); the rest wait
+    for its result. Keys are tuples whose first element is a namespace, which
+    lets writers invalidate a whole namespace or a key prefix.
+    
+    A load that overlaps an invalidation of its own key (or a prefix of it)
+    still answers its callers but isn't stored. Invalidations are tracked per
+    prefix, so a write to one policy doesn't stop loads of every other key
+    from being cached.
+    
+    The cache is per process: with several workers each keeps its own copy and
+    a write is only invalidated in the worker that handled it, so other
+    workers can serve stale data for up to ttl_seconds.
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30.0, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        # Invalidation clock; prefix -> clock value at its latest invalidation
+        self._clock = 0
+        self._invalidated: Dict[Tuple, int] = {}
+        # Clock values at which the loads still running started
+        self._load_starts: Counter = Counter()
+        
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    async def get_or_load(self, key: Tuple[Hashable, ...], loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, awaiting loader() on a miss"""
+        if not self.enabled:
+            return await loader()
+        
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return value
+                    del self._entries[key]
+                
+                flight = self._flights.get(key)
+                if flight is None:
+                    break
+                self.coalesced += 1
+            
+            try:
+                # shield: a waiter disconnecting must not cancel the shared load
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The leading request was cancelled; retry and maybe lead
+        
+        with self._lock:
+            flight = asyncio.get_running_loop().create_future()
+            self._flights[key] = flight
+            started = self._clock
+            self._load_starts[started] += 1
+            self.misses += 1
+        
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            flight.exception()  # Mark retrieved when nobody was waiting
+            raise
+        else:
+            flight.set_result(value)
+            with self._lock:
+                # Don't store a value loaded across an invalidation, it may be stale
+                if not self._invalidated_since(key, started):
+                    self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            return value
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._load_starts[started] -= 1
+                if not self._load_starts[started]:
+                    del self._load_starts[started]
+    
+    def _invalidated_since(self, key: Tuple, clock: int) -> bool:
+        """True if key or any prefix of it was invalidated after clock"""
+        return any(self._invalidated.get(key[:n], 0) > clock for n in range(len(key) + 1))
+    
+    def invalidate(self, *prefix: Hashable) -> None:
+        """Drop every entry whose key starts with prefix (everything if empty)"""
+        with self._lock:
+            self._clock += 1
+            self._invalidated[prefix] = self._clock
+            self.invalidations += 1
+            
+            if len(self._invalidated) > self.max_entries:
+                # Marks no running load started before are no longer needed
+                oldest = min(self._load_starts, default=self._clock)
+                for stale in [stale for stale, clock in self._invalidated.items() if clock <= oldest]:
+                    del self._invalidated[stale]
+            
+            n = len(prefix)
+            for key in [key for key in self._entries if key[:n] == prefix]:
+                del self._entries[key]
+            # Later misses must not join loads that started before this write
+            for key in [key for key in self._flights if key[:n] == prefix]:
+                del self._flights[key]
+    
+    def clear(self) -> None:
+        self.invalidate()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+)
+
+
+def invalidate_feed() -> None:
+    """Call after a policy is created or its content changes so feed pages are rebuilt"""
+    response_cache.invalidate("feed")
+
+
+def invalidate_policy(policy_id: int) -> None:
+    """Call after a vote on (or change to) policy_id; feed pages show its stats too"""
+    response_cache.invalidate("policy", policy_id)
+    response_cache.invalidate("results", policy_id)
+    invalidate_feed()
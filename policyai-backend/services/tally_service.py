@@ -0,0 +1,174 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+from sqlalchemy import case, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models.policy import Policy
+from models.policy_vote_tally import PolicyVoteTally
+from models.vote import Vote
+
+# Tally column that counts each stance
+STANCE_COLUMNS = {
+    "support": "support_count",
+    "oppose": "oppose_count",
+    "neutral": "neutral_count",
+}
+
+COUNT_COLUMNS = ["support_count", "oppose_count", "neutral_count", "total_votes"]
+
+
+def stance_delta(old_stance: Optional[str], new_stance: Optional[str]) -> Dict[str, int]:
+    """Column increments for a vote moving from old_stance to new_stance (None = no vote)"""
+    delta = dict.fromkeys(COUNT_COLUMNS, 0)
+    
+    if old_stance == new_stance:
+        return delta
+    
+    if old_stance is not None:
+        if old_stance in STANCE_COLUMNS:
+            delta[STANCE_COLUMNS[old_stance]] -= 1
+        delta["total_votes"] -= 1
+    
+    if new_stance is not None:
+        if new_stance in STANCE_COLUMNS:
+            delta[STANCE_COLUMNS[new_stance]] += 1
+        delta["total_votes"] += 1
+    
+    return delta
+
+
+def _add_on_conflict(stmt):
+    """ON CONFLICT clause that adds the inserted counts onto an existing tally row"""
+    return stmt.on_conflict_do_update(
+        index_elements=[PolicyVoteTally.policy_id],
+        set_={
+            **{
+                column: getattr(PolicyVoteTally, column) + getattr(stmt.excluded, column)
+                for column in COUNT_COLUMNS
+            },
+            "version": PolicyVoteTally.version + 1,
+            "updated_at": func.now(),
+        },
+    )
+
+
+async def apply_tally_deltas(db: AsyncSession, deltas: Dict[int, Dict[str, int]]) -> None:
+    """Add per-policy count deltas to the tally table in one upsert.
+    
+    Runs inside the caller's transaction, so the tallies commit (or roll back)
+    together with the vote rows that caused them.
+    """
+    rows = [
+        {"policy_id": policy_id, "version": 1, **{column: delta.get(column, 0) for column in COUNT_COLUMNS}}
+        for policy_id, delta in sorted(deltas.items())
+        if any(delta.get(column, 0) for column in COUNT_COLUMNS)
+    ]
+    if not rows:
+        return
+    
+    await db.execute(_add_on_conflict(pg_insert(PolicyVoteTally).values(rows)))
+
+
+def tally_upsert_from(votes, previous_stance: Optional[str] = None, removed: bool = False):
+    """Tally upsert driven by the RETURNING rows of a vote write CTE.
+    
+    Embedding it in the same statement as the vote INSERT/UPDATE/DELETE keeps
+    the tally change atomic with the vote and saves a round trip. votes must
+    expose policy_id and stance; previous_stance names a column holding the
+    stance being replaced, for updates, and removed=True means the returned
+    votes were deleted.
+    """
+    new = votes.c.stance
+    old = votes.c[previous_stance] if previous_stance else None
+    
+    def counts(stance_column, stance=None):
+        matches = stance_column.isnot(None) if stance is None else stance_column == stance
+        return case((matches, 1), else_=0)
+    
+    deltas = []
+    for stance in [*STANCE_COLUMNS, None]:
+        delta = -counts(new, stance) if removed else counts(new, stance)
+        if old is not None:
+            delta = delta - counts(old, stance)
+        deltas.append(delta)
+    
+    rows = select(votes.c.policy_id, *deltas, literal(1))
+    if old is not None:
+        rows = rows.where(new.is_distinct_from(old))
+    
+    return _add_on_conflict(
+        pg_insert(PolicyVoteTally).from_select(["policy_id", *COUNT_COLUMNS, "version"], rows)
+    )
+
+
+def backfill_missing_tallies(db: Session) -> int:
+    """Create tally rows, counted from votes, for policies that have none yet.
+    
+    Every policy needs a tally row to show up in the most_voted feed sort.
+    Returns the number of rows created.
+    """
+    missing = select(
+        Policy.id,
+        func.count(Vote.id).filter(Vote.stance == "support"),
+        func.count(Vote.id).filter(Vote.stance == "oppose"),
+        func.count(Vote.id).filter(Vote.stance == "neutral"),
+        func.count(Vote.id),
+    ).outerjoin(
+        Vote, Vote.policy_id == Policy.id
+    ).where(
+        ~select(PolicyVoteTally.policy_id).where(PolicyVoteTally.policy_id == Policy.id).exists()
+    ).group_by(Policy.id)
+    
+    stmt = pg_insert(PolicyVoteTally).from_select(["policy_id", *COUNT_COLUMNS], missing)
+    result = db.execute(stmt.on_conflict_do_nothing(index_elements=[PolicyVoteTally.policy_id]))
+    return result.rowcount
+
+
+def reconcile_tallies(db: Session, apply: bool = True) -> List[dict]:
+    """Rebuild tallies from the votes table and return the drift that was found.
+    
+    With apply=True the votes table is locked against writes for the duration
+    of the transaction so no vote can land between the recount and the rewrite.
+    """
+    if apply:
+        db.execute(text("LOCK TABLE votes IN SHARE MODE"))
+    
+    actual = defaultdict(lambda: dict.fromkeys(COUNT_COLUMNS, 0))
+    vote_counts = db.execute(
+        select(Vote.policy_id, Vote.stance, func.count(Vote.id)).group_by(Vote.policy_id, Vote.stance)
+    ).all()
+    for policy_id, stance, count in vote_counts:
+        column = STANCE_COLUMNS.get(stance)
+        if column:
+            actual[policy_id][column] += count
+        actual[policy_id]["total_votes"] += count
+    
+    stored = {
+        tally.policy_id: {column: getattr(tally, column) for column in COUNT_COLUMNS}
+        for tally in db.query(PolicyVoteTally).all()
+    }
+    
+    policy_ids = set(db.scalars(select(Policy.id)).all())
+    
+    drift = []
+    for policy_id in sorted(policy_ids | set(actual) | set(stored)):
+        expected = actual.get(policy_id, dict.fromkeys(COUNT_COLUMNS, 0))
+        found = stored.get(policy_id)
+        if found != expected and policy_id in policy_ids:
+            drift.append({"policy_id": policy_id, "stored": found, "actual": expected})
+    
+    if apply and drift:
+        rows = [{"policy_id": item["policy_id"], "version": 1, **item["actual"]} for item in drift]
+        stmt = pg_insert(PolicyVoteTally).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PolicyVoteTally.policy_id],
+            set_={
+                **{column: getattr(stmt.excluded, column) for column in COUNT_COLUMNS},
+                "version": PolicyVoteTally.version + 1,
+                "updated_at": func.now(),
+            },
+        )
+        db.execute(stmt)
+    
+    return drift
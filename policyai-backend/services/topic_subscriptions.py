@@ -0,0 +1,292 @@
+import asyncio
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import AsyncSessionLocal
+from models.topic_subscription_change import TopicSubscriptionChange
+from models.user import User
+from services import fcm_service
+
+# Devices without category preferences get every policy through this topic
+GLOBAL_TOPIC = "policies"
+
+# FCM accepts at most 1000 tokens per subscribe / unsubscribe call
+FCM_MAX_TOPIC_BATCH_SIZE = 1000
+
+# Topic management errors that mean the token itself is no good
+DEAD_TOKEN_REASONS = {"NOT_FOUND", "INVALID_ARGUMENT"}
+
+# Longest wait before changes FCM didn't answer are sent again
+MAX_RETRY_BACKOFF_SECONDS = 300.0
+
+
+def category_topic(category: str) -> str:
+    """FCM topic name for a policy category (topics allow [a-zA-Z0-9-_.~%])"""
+    slug = re.sub(r"[^a-z0-9_.~-]+", "-", (category or "").strip().lower()).strip("-")
+    return f"category-{slug or 'uncategorized'}"
+
+
+def topics_for(categories: Optional[List[str]]) -> List[str]:
+    """Topics a device should be in: its categories, or the global topic.
+    
+    The two are exclusive so a device never gets the same policy twice.
+    """
+    if not categories:
+        return [GLOBAL_TOPIC]
+    return sorted({category_topic(category) for category in categories})
+
+
+class TopicSubscriptionQueue:
+    """Batches topic subscription changes into FCM's bulk calls.
+    
+    subscribe/unsubscribe only record the latest wanted state per
+    (topic, token); a background task flushes every flush_seconds, or
+    sooner once batch_size changes are waiting, with one call per topic and
+    direction per batch_size tokens. Tokens FCM rejects as unknown or
+    invalid are cleared from users.fcm_token.
+    
+    Changes FCM didn't answer (the call failed, or the token got a
+    retryable error) are sent again after retry_backoff_seconds, doubling
+    while retries keep failing, unless a newer change for the token was
+    queued meanwhile.
+    
+    Callers also record each change in fcm_topic_changes inside their own
+    transaction; rows are deleted once FCM answered for them and replayed
+    when the queue starts, so a restart between commit and flush loses
+    nothing.
+    
+    Known limitation: quarantine (see NotificationDispatcher) only applies
+    to per-token sends. A quarantined token stays subscribed to its topics,
+    as FCM reports no per-device outcome for topic messages to act on; dead
+    tokens are dropped from topics by FCM itself.
+    """
+    
+    def __init__(
+        self,
+        flush_seconds: float = 2.0,
+        batch_size: int = FCM_MAX_TOPIC_BATCH_SIZE,
+        retry_backoff_seconds: float = 5.0,
+    ):
+        self.flush_seconds = flush_seconds
+        self.batch_size = min(batch_size, FCM_MAX_TOPIC_BATCH_SIZE)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        
+        # topic -> {token: True to subscribe, False to unsubscribe}
+        self._pending: Dict[str, Dict[str, bool]] = {}
+        self._pending_count = 0
+        # Unanswered changes waiting for _retry_at, same shape as _pending
+        self._retrying: Dict[str, Dict[str, bool]] = {}
+        self._retry_failures = 0
+        self._retry_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        
+        self.flushes = 0
+        self.calls = 0
+        self.subscribed = 0
+        self.unsubscribed = 0
+        self.failed = 0
+        self.removed = 0
+        self.restored = 0
+        self.retried = 0
+    
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+    
+    def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._work())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Don't lose changes that were waiting for the next flush
+        await self.flush()
+    
+    def _queue(self, token: str, topics: Iterable[str], subscribe: bool) -> None:
+        if not token or not fcm_service.FIREBASE_AVAILABLE:
+            return
+        
+        for topic in topics:
+            tokens = self._pending.setdefault(topic, {})
+            if token not in tokens:
+                self._pending_count += 1
+            tokens[token] = subscribe
+            # Supersedes a change still waiting to be retried
+            self._retrying.get(topic, {}).pop(token, None)
+        
+        if self._wakeup is not None and self._pending_count >= self.batch_size:
+            self._wakeup.set()
+    
+    def subscribe(self, token: str, topics: Iterable[str]) -> None:
+        self._queue(token, topics, True)
+    
+    def unsubscribe(self, token: str, topics: Iterable[str]) -> None:
+        self._queue(token, topics, False)
+    
+    async def record(self, db: AsyncSession, token: str, topics: Iterable[str], subscribe: bool) -> None:
+        """Persist a change in db's transaction; queue it with subscribe /
+        unsubscribe once the caller committed"""
+        topics = list(topics)
+        if not token or not topics or not fcm_service.FIREBASE_AVAILABLE:
+            return
+        
+        statement = pg_insert(TopicSubscriptionChange).values([
+            {"token": token, "topic": topic, "subscribe": subscribe} for topic in topics
+        ])
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[TopicSubscriptionChange.token, TopicSubscriptionChange.topic],
+            set_={"subscribe": statement.excluded.subscribe, "created_at": statement.excluded.created_at},
+        ))
+    
+    async def _restore(self) -> None:
+        """Queue the changes a previous process recorded but never flushed"""
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(TopicSubscriptionChange.token, TopicSubscriptionChange.topic, TopicSubscriptionChange.subscribe)
+            )).all()
+        for token, topic, subscribe in rows:
+            self._queue(token, [topic], subscribe)
+        self.restored += len(rows)
+        if rows:
+            print(f"↪️ Restored {len(rows)} unconfirmed topic subscription changes")
+    
+    async def _work(self) -> None:
+        try:
+            await self._restore()
+        except Exception as e:
+            print(f"❌ Restoring topic subscription changes failed: {e}")
+        
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Topic subscription flush failed: {e}")
+    
+    async def _call(self, topic: str, tokens: List[str], subscribe: bool) -> Tuple[List[str], List[str]]:
+        """One bulk call; returns the tokens FCM gave a final answer for
+        (done, or dead) and the tokens it reported as dead"""
+        call = fcm_service.messaging.subscribe_to_topic if subscribe else fcm_service.messaging.unsubscribe_from_topic
+        self.calls += 1
+        try:
+            # The SDK has no async variant of topic management
+            response = await asyncio.to_thread(call, tokens, topic)
+        except Exception as e:
+            self.failed += len(tokens)
+            print(f"❌ {'Subscribing' if subscribe else 'Unsubscribing'} {len(tokens)} tokens to '{topic}' failed: {e}")
+            return [], []
+        
+        if subscribe:
+            self.subscribed += response.success_count
+        else:
+            self.unsubscribed += response.success_count
+        self.failed += response.failure_count
+        
+        dead = [tokens[error.index] for error in response.errors if error.reason in DEAD_TOKEN_REASONS]
+        retry = {error.index for error in response.errors if error.reason not in DEAD_TOKEN_REASONS}
+        return [token for index, token in enumerate(tokens) if index not in retry], dead
+    
+    def _requeue_due(self) -> None:
+        """Move changes waiting to be retried back into _pending once their backoff passed"""
+        if not self._retrying or time.monotonic() < self._retry_at:
+            return
+        
+        retrying, self._retrying = self._retrying, {}
+        for topic, tokens in retrying.items():
+            for token, subscribe in tokens.items():
+                self._queue(token, [topic], subscribe)
+                self.retried += 1
+    
+    def _hold_for_retry(self, unanswered: List[Tuple[str, str, bool]]) -> None:
+        """Keep unanswered changes for a later flush, backing off while retries keep failing"""
+        if not unanswered:
+            if not self._retrying:
+                self._retry_failures = 0
+            return
+        
+        for token, topic, subscribe in unanswered:
+            # A change queued while this flush ran is newer; it wins
+            if token not in self._pending.get(topic, {}):
+                self._retrying.setdefault(topic, {})[token] = subscribe
+        
+        self._retry_failures += 1
+        delay = self.retry_backoff_seconds * 2 ** (self._retry_failures - 1)
+        self._retry_at = time.monotonic() + min(delay, MAX_RETRY_BACKOFF_SECONDS)
+    
+    async def flush(self) -> None:
+        self._requeue_due()
+        if not self._pending:
+            return
+        
+        pending, self._pending, self._pending_count = self._pending, {}, 0
+        self.flushes += 1
+        
+        settled, dead, unanswered = [], set(), []
+        for topic, tokens in pending.items():
+            for subscribe in (False, True):
+                selected = [token for token, wanted in tokens.items() if wanted is subscribe]
+                for start in range(0, len(selected), self.batch_size):
+                    batch = selected[start:start + self.batch_size]
+                    answered, rejected = await self._call(topic, batch, subscribe)
+                    settled.extend((token, topic, subscribe) for token in answered)
+                    dead.update(rejected)
+                    answered = set(answered)
+                    unanswered.extend((token, topic, subscribe) for token in batch if token not in answered)
+        
+        self._hold_for_retry(unanswered)
+        if not settled and not dead:
+            return
+        
+        async with AsyncSessionLocal() as db:
+            # Only rows still wanting what was sent; a newer change stays queued
+            change = tuple_(TopicSubscriptionChange.token, TopicSubscriptionChange.topic, TopicSubscriptionChange.subscribe)
+            for start in range(0, len(settled), self.batch_size):
+                await db.execute(delete(TopicSubscriptionChange).where(change.in_(settled[start:start + self.batch_size])))
+            if dead:
+                await db.execute(
+                    update(User).where(User.fcm_token.in_(dead)).values(fcm_token=None)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+        
+        if dead:
+            self.removed += len(dead)
+            print(f"🧹 Removed {len(dead)} dead FCM tokens found by topic management")
+    
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": self._pending_count,
+            "retrying": sum(len(tokens) for tokens in self._retrying.values()),
+            "flush_seconds": self.flush_seconds,
+            "batch_size": self.batch_size,
+            "flushes": self.flushes,
+            "calls": self.calls,
+            "subscribed": self.subscribed,
+            "unsubscribed": self.unsubscribed,
+            "failed": self.failed,
+            "removed": self.removed,
+            "restored": self.restored,
+            "retried": self.retried,
+        }
+
+
+topic_subscriptions = TopicSubscriptionQueue(
+    flush_seconds=settings.FCM_TOPIC_FLUSH_SECONDS,
+    retry_backoff_seconds=settings.FCM_TOPIC_RETRY_BACKOFF_SECONDS,
+)
@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+from sqlalchemy import select
+from database import AsyncSessionLocal, async_engine
+import models  # noqa: F401 - register all mappers
+from models.user import User
+from services import fcm_service
+from services.topic_subscriptions import TopicSubscriptionQueue, topics_for
+
+
+async def sync_topics(chunk_size: int = 1000):
+    """Subscribe every stored FCM token to its notification topics.
+    
+    Needed once for tokens registered before topic broadcasts; topic
+    subscriptions are idempotent, so rerunning is harmless.
+    """
+    if not fcm_service.FIREBASE_AVAILABLE:
+        print("❌ FCM is not configured; nothing to subscribe")
+        return None
+    
+    queue = TopicSubscriptionQueue()
+    tokens = 0
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(User.fcm_token, User.notification_categories)
+            .where(User.fcm_token.isnot(None))
+            .execution_options(yield_per=chunk_size)
+        )
+        async for chunk in result.partitions():
+            for token, categories in chunk:
+                queue.subscribe(token, topics_for(categories))
+            tokens += len(chunk)
+            await queue.flush()
+            print(f"📦 {tokens} tokens subscribed so far")
+    
+    await async_engine.dispose()
+    
+    stats = queue.stats()
+    print(f"✅ {tokens} tokens: {stats['subscribed']} subscriptions, {stats['failed']} failed, {stats['removed']} dead tokens removed")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subscribe existing FCM tokens to their notification topics")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="tokens read and subscribed per batch")
+    args = parser.parse_args()
+    
+    asyncio.run(sync_topics(chunk_size=args.chunk_size))